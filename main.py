@@ -1,17 +1,41 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
+from fastapi.concurrency import run_in_threadpool
+import anyio.to_thread
+import asyncio
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional
 
-from rag.file_reader import extract_text_from_file, get_supported_extensions
+from rag.file_reader import extract_text_from_file, extract_texts, get_supported_extensions
 from rag.vector_store import VectorStore, chunk_text
-from rag.ollama_client import OllamaClient, get_chat_model, get_embedding_model
-from rag.rag_methods import get_rag_method, RAG_METHODS, SimpleRAG
+from rag.ollama_client import OllamaClient, get_chat_model, get_embedding_model, close_async_client
+from rag.rag_methods import get_rag_method, RAG_METHODS
 
-app = FastAPI(title="RAG Service")
+# 日志经队列交给后台线程写出，避免每条日志在事件循环上同步 flush stdout
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, logging.StreamHandler(), respect_handler_level=True
+)
+_log_listener.start()
+logging.basicConfig(
+    level=logging.INFO,
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
+)
+
+log = logging.getLogger(__name__)
+
+# orjson 序列化比标准库 json 快数倍，上传响应里整篇提取文本受益最大
+app = FastAPI(title="RAG Service", default_response_class=ORJSONResponse)
 
 # CORS 配置
 app.add_middleware(
@@ -29,6 +53,14 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 INDEX_DIR = Path("indexes")
 INDEX_DIR.mkdir(exist_ok=True)
 
+# 提取结果缓存目录（按内容哈希存储，相同内容的文件不重复解析）
+CACHE_DIR = Path("cache")
+CACHE_DIR.mkdir(exist_ok=True)
+
+# 上传文件元信息目录（记录内容哈希、大小）
+META_DIR = UPLOAD_DIR / ".meta"
+META_DIR.mkdir(exist_ok=True)
+
 # 向量存储实例
 vector_store = VectorStore(index_dir=str(INDEX_DIR))
 
@@ -39,16 +71,120 @@ ollama_client = OllamaClient()
 app.mount("/static", StaticFiles(directory="static", html=True), name="static")
 
 
-@app.get("/")
-async def root():
-    """返回首页"""
-    return FileResponse("static/index.html")
+@app.on_event("startup")
+async def setup_thread_pool():
+    """限制线程池大小，阻塞任务过多时排队而不是无限开线程"""
+    max_workers = min(32, (os.cpu_count() or 4) * 2)
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_workers))
+    # run_in_threadpool 不走上面的 executor，而是 anyio 自带的
+    # 容量限制器（默认 40 线程），这里把它设成同一个上限
+    anyio.to_thread.current_default_thread_limiter().total_tokens = max_workers
+
+
+@app.on_event("startup")
+async def warmup_models():
+    """后台预热 Ollama 模型，把冷启动加载挪到服务启动阶段"""
+    def _warm():
+        try:
+            get_embedding_model().warmup()
+            get_chat_model().warmup()
+            log.info("Ollama 模型预热完成")
+        except Exception as e:
+            log.warning(f"Ollama 模型预热失败: {str(e)}")
+
+    # 不阻塞启动，预热在线程池里进行
+    asyncio.get_running_loop().run_in_executor(None, _warm)
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """停机时关闭共享的 HTTP 连接池"""
+    await close_async_client()
+
+
+# RAG 方法展示信息（启动时构建一次，不在请求路径上实例化方法）
+_METHOD_INFO = {
+    key: {"id": key, "name": method.description}
+    for key, method in RAG_METHODS.items()
+}
+
+# /chat 精确匹配缓存（LRU，重复问题直接返回，省掉检索和 LLM 往返）
+_chat_cache: OrderedDict = OrderedDict()
+_CHAT_CACHE_MAX = 1024
+
+
+def _clear_chat_cache():
+    """索引内容变化后清空回答缓存，避免返回过期结果"""
+    _chat_cache.clear()
+
+
+# 已索引文件集合缓存（按目录 mtime 失效，避免每个请求都遍历索引目录）
+_indexed_cache = {"mtime": -1, "files": set()}
+
+
+def _get_indexed_files() -> set:
+    """获取已索引文件名集合（索引目录未变化时直接返回缓存）"""
+    mtime = INDEX_DIR.stat().st_mtime_ns
+    if mtime != _indexed_cache["mtime"]:
+        _indexed_cache["files"] = {
+            p.name[:-6] for p in INDEX_DIR.iterdir()
+            if p.is_file() and p.name.endswith('.index')
+        }
+        _indexed_cache["mtime"] = mtime
+    return _indexed_cache["files"]
+
+
+def _save_upload_meta(filename: str, content_hash: str, size: int):
+    """保存上传文件的元信息（内容哈希、大小）"""
+    meta_file = META_DIR / f"{filename}.json"
+    try:
+        with meta_file.open('w', encoding='utf-8') as f:
+            json.dump({"hash": content_hash, "size": size}, f, ensure_ascii=False)
+    except Exception as e:
+        log.error(f"保存元信息失败: {filename}, 错误: {str(e)}")
+
+
+def _load_upload_meta(filename: str) -> Optional[dict]:
+    """读取上传文件的元信息，不存在返回 None"""
+    meta_file = META_DIR / f"{filename}.json"
+    if not meta_file.exists():
+        return None
+    try:
+        with meta_file.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _get_cached_text(content_hash: str) -> Optional[str]:
+    """按内容哈希读取缓存的提取文本，未命中返回 None"""
+    cache_file = CACHE_DIR / f"{content_hash}.txt"
+    if not cache_file.exists():
+        return None
+    try:
+        return cache_file.read_text(encoding='utf-8')
+    except Exception:
+        return None
+
+
+def _cache_text(content_hash: str, content: str):
+    """按内容哈希缓存提取文本"""
+    cache_file = CACHE_DIR / f"{content_hash}.txt"
+    try:
+        cache_file.write_text(content, encoding='utf-8')
+    except Exception as e:
+        log.error(f"缓存提取文本失败: {str(e)}")
 
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """上传文件接口，支持文本、PDF、Word 和 Excel"""
-    print(f"收到文件上传请求: {file.filename}, 类型: {file.content_type}")
+async def upload_file(file: UploadFile = File(...), extract: bool = False):
+    """上传文件接口，支持文本、PDF、Word 和 Excel
+
+    默认只保存文件；extract=true 时同步提取内容并随响应返回，
+    重量级解析留给 /index 端点
+    """
+    log.info(f"收到文件上传请求: {file.filename}, 类型: {file.content_type}")
     
     # 检查文件类型
     allowed_extensions = {'.txt', '.md', '.csv', '.pdf', '.doc', '.docx', '.xls', '.xlsx'}
@@ -60,34 +196,50 @@ async def upload_file(file: UploadFile = File(...)):
             detail=f"不支持的文件类型。仅支持: {', '.join(allowed_extensions)}"
         )
     
-    # 保存文件
+    # 保存文件（流式写入，避免大文件一次性读入内存阻塞事件循环）
+    # 写入的同时计算内容哈希，用于提取结果缓存
     file_path = UPLOAD_DIR / file.filename
     try:
+        hasher = hashlib.sha256()
         with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 使用统一的文件读取方法提取内容
-        content = extract_text_from_file(file_path)
-        if content:
-            print(f"成功提取文件内容: {file.filename}")
-            # 统计文本块数量
-            chunks = chunk_text(content)
-            print(f"文本被分割为 {len(chunks)} 个块")
-        else:
-            print(f"无法提取文件内容或文件类型不支持: {file.filename}")
-        
-        print(f"文件上传成功: {file.filename}, 大小: {file_path.stat().st_size}")
-        
-        return JSONResponse({
+            while chunk := await file.read(1024 * 1024):
+                hasher.update(chunk)
+                buffer.write(chunk)
+        content_hash = hasher.hexdigest()
+        _save_upload_meta(file.filename, content_hash, file_path.stat().st_size)
+
+        content = None
+        chunks = []
+        if extract:
+            # 相同内容的文件直接复用缓存的提取结果，跳过解析
+            content = _get_cached_text(content_hash)
+            if content is not None:
+                log.info(f"命中内容缓存: {file.filename} ({content_hash[:12]})")
+            else:
+                # 使用统一的文件读取方法提取内容（解析放到线程池，避免阻塞事件循环）
+                content = await run_in_threadpool(extract_text_from_file, file_path)
+                if content:
+                    _cache_text(content_hash, content)
+            if content:
+                log.info(f"成功提取文件内容: {file.filename}")
+                # 统计文本块数量
+                chunks = await run_in_threadpool(chunk_text, content)
+                log.info(f"文本被分割为 {len(chunks)} 个块")
+            else:
+                log.info(f"无法提取文件内容或文件类型不支持: {file.filename}")
+
+        log.info(f"文件上传成功: {file.filename}, 大小: {file_path.stat().st_size}")
+
+        return ORJSONResponse({
             "message": "文件上传成功",
             "filename": file.filename,
             "file_type": file_ext,
             "content": content,
             "size": file_path.stat().st_size,
-            "chunk_count": len(chunk_text(content)) if content else 0
+            "chunk_count": len(chunks)
         })
     except Exception as e:
-        print(f"文件上传失败: {str(e)}")
+        log.error(f"文件上传失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
 
@@ -100,17 +252,20 @@ async def chat(message: dict):
     
     if not user_message:
         raise HTTPException(status_code=400, detail="消息内容不能为空")
-    
+
+    # 相同问题命中缓存时直接返回
+    cache_key = (rag_method, user_message, polish)
+    if cache_key in _chat_cache:
+        _chat_cache.move_to_end(cache_key)
+        return ORJSONResponse(_chat_cache[cache_key])
+
     # 获取 RAG 方法
     rag = get_rag_method(rag_method)
-    method_info = {
-        "id": rag_method,
-        "name": RAG_METHODS.get(rag_method, SimpleRAG()).description if rag_method in RAG_METHODS else "未知方法"
-    }
+    method_info = _METHOD_INFO.get(rag_method, {"id": rag_method, "name": "未知方法"})
     
-    # 调用 RAG 方法生成回答
+    # 调用 RAG 方法生成回答（检索 + LLM 调用均为阻塞操作，放到线程池）
     try:
-        result = rag.chat(user_message, vector_store, polish=polish)
+        result = await run_in_threadpool(rag.chat, user_message, vector_store, polish=polish)
         
         # 处理新格式的返回（dict）
         if isinstance(result, dict):
@@ -123,19 +278,26 @@ async def chat(message: dict):
             sources = []
             source_type = "local"
         
-        return JSONResponse({
+        payload = {
             "message": response_content,
             "method": method_info,
             "sources": sources,
             "source_type": source_type,
             "timestamp": "2026-01-07"
-        })
+        }
+
+        # 写入缓存并淘汰最久未使用的条目
+        _chat_cache[cache_key] = payload
+        if len(_chat_cache) > _CHAT_CACHE_MAX:
+            _chat_cache.popitem(last=False)
+
+        return ORJSONResponse(payload)
     except Exception as e:
-        print(f"RAG 生成失败: {str(e)}")
+        log.error(f"RAG 生成失败: {str(e)}")
         # 回退到简单聊天
         chat_model = get_chat_model()
-        response = chat_model.chat(user_message)
-        return JSONResponse({
+        response = await run_in_threadpool(chat_model.chat, user_message)
+        return ORJSONResponse({
             "message": response,
             "method": method_info,
             "sources": [],
@@ -145,6 +307,29 @@ async def chat(message: dict):
         })
 
 
+@app.post("/chat/stream")
+async def chat_stream(message: dict):
+    """流式聊天接口（SSE）：逐 token 推送，首字节延迟为首 token 延迟"""
+    user_message = message.get("message", "")
+    rag_method = message.get("rag_method", "option1")  # 默认 SimpleRAG
+
+    if not user_message:
+        raise HTTPException(status_code=400, detail="消息内容不能为空")
+
+    rag = get_rag_method(rag_method)
+
+    def event_stream():
+        try:
+            for event in rag.stream_chat(user_message, vector_store):
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            log.error(f"流式 RAG 生成失败: {str(e)}")
+            yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.post("/index")
 async def create_index(request: dict):
     """创建文档索引"""
@@ -155,50 +340,90 @@ async def create_index(request: dict):
     
     indexed_count = 0
     failed_files = []
-    
+    all_texts = []
+    all_metadatas = []
+    chunk_counts = {}  # filename -> 块数，用于写索引标记
+
+    # 第一遍：检查文件、复用上传时按内容哈希缓存的提取结果，
+    # 攒下缓存未命中的文件待批量解析
+    contents = {}  # filename -> 提取文本
+    pending = []   # [(filename, 路径, 元信息)]，缓存未命中
     for filename in filenames:
         file_path = UPLOAD_DIR / filename
-        
+
         if not file_path.exists():
             failed_files.append({"filename": filename, "error": "文件不存在"})
             continue
-        
-        # 提取文件内容
-        content = extract_text_from_file(file_path)
+
+        content = None
+        meta = _load_upload_meta(filename)
+        if meta and meta.get("hash"):
+            content = _get_cached_text(meta["hash"])
+            if content is not None:
+                log.info(f"复用上传时的提取结果: {filename}")
+
+        if content is None:
+            pending.append((filename, file_path, meta))
+        else:
+            contents[filename] = content
+
+    # 未命中的文件批量交给进程池解析（PDF/Word 解析是 CPU 密集，
+    # 多个文件摊到多核），整批仍在线程池里等待以免阻塞事件循环
+    if pending:
+        extracted = await run_in_threadpool(
+            extract_texts, [path for _, path, _ in pending]
+        )
+        for (filename, _, meta), content in zip(pending, extracted):
+            if content and meta and meta.get("hash"):
+                _cache_text(meta["hash"], content)
+            contents[filename] = content
+
+    for filename in filenames:
+        if filename not in contents:
+            continue  # 文件不存在，已记入 failed_files
+        content = contents[filename]
         if not content:
             failed_files.append({"filename": filename, "error": "无法提取文件内容"})
             continue
-        
+
         # 分割文本
-        chunks = chunk_text(content)
+        chunks = await run_in_threadpool(chunk_text, content)
         if not chunks:
             failed_files.append({"filename": filename, "error": "文本分割失败"})
             continue
-        
+
         # 创建元数据
         metadatas = [{
             "source": filename,
             "chunk_index": i
         } for i in range(len(chunks))]
-        
-        # 添加到向量存储
-        vector_store.add_documents(
-            texts=chunks,
-            metadatas=metadatas,
+
+        all_texts.extend(chunks)
+        all_metadatas.extend(metadatas)
+        chunk_counts[filename] = len(chunks)
+
+    # 所有文件的块合并成一个批次嵌入，摊薄每个文件单独请求的往返开销
+    if all_texts:
+        await run_in_threadpool(
+            vector_store.add_documents,
+            texts=all_texts,
+            metadatas=all_metadatas,
             store_name="default"
         )
-        
-        # 创建索引标记文件
+        _clear_chat_cache()
+
+    # 创建索引标记文件
+    for filename, count in chunk_counts.items():
         index_file = INDEX_DIR / f"{filename}.index"
         try:
             with open(index_file, 'w') as f:
-                f.write(f"chunks={len(chunks)}\\n")
+                f.write(f"chunks={count}\\n")
             indexed_count += 1
-            print(f"索引创建成功: {filename}, {len(chunks)} 个块")
+            log.info(f"索引创建成功: {filename}, {count} 个块")
         except Exception as e:
             failed_files.append({"filename": filename, "error": f"索引标记失败: {str(e)}"})
     
-    return JSONResponse({
+    return ORJSONResponse({
         "message": f"成功索引 {indexed_count} 个文件",
         "indexed_count": indexed_count,
         "failed_files": failed_files
@@ -225,25 +450,26 @@ async def delete_index(request: dict):
             if index_existed:
                 index_file.unlink()
             
-            # 从向量存储中删除该文件的文档
-            success = vector_store.delete_documents_by_source(filename)
+            # 从向量存储中删除该文件的文档（重建索引阻塞，放到线程池）
+            success = await run_in_threadpool(vector_store.delete_documents_by_source, filename)
             
             if index_existed or success:
                 deleted.append(filename)
-                print(f"索引删除成功: {filename}")
+                log.info(f"索引删除成功: {filename}")
             else:
                 not_found.append(filename)
                 
         except Exception as e:
-            print(f"索引删除失败: {filename}, 错误: {str(e)}")
+            log.error(f"索引删除失败: {filename}, 错误: {str(e)}")
             not_found.append(filename)
     
     if deleted:
+        _clear_chat_cache()
         message = f"成功删除 {len(deleted)} 个文件的索引"
     else:
         message = "没有找到要删除的索引"
     
-    return JSONResponse({
+    return ORJSONResponse({
         "message": message,
         "deleted": deleted,
         "not_found": not_found
@@ -254,24 +480,23 @@ async def delete_index(request: dict):
 async def get_index_status():
     """获取所有已索引文件的状态"""
     indexed_files = []
-    for index_file in INDEX_DIR.iterdir():
-        if index_file.is_file() and index_file.name.endswith('.index'):
-            filename = index_file.name[:-6]
-            # 读取索引信息
-            try:
-                with open(index_file, 'r') as f:
-                    info = f.read()
-                indexed_files.append({
-                    "filename": filename,
-                    "info": info.strip()
-                })
-            except:
-                indexed_files.append({"filename": filename, "info": "未知"})
+    for filename in _get_indexed_files():
+        index_file = INDEX_DIR / f"{filename}.index"
+        # 读取索引信息
+        try:
+            with open(index_file, 'r') as f:
+                info = f.read()
+            indexed_files.append({
+                "filename": filename,
+                "info": info.strip()
+            })
+        except:
+            indexed_files.append({"filename": filename, "info": "未知"})
     
     # 获取向量存储统计
     stats = vector_store.get_stats()
     
-    return JSONResponse({
+    return ORJSONResponse({
         "indexed_files": indexed_files,
         "vector_store_stats": stats
     })
@@ -281,22 +506,21 @@ async def get_index_status():
 async def list_uploads():
     """获取已上传的文件列表"""
     # 获取已索引文件列表
-    indexed_files = set()
-    for index_file in INDEX_DIR.iterdir():
-        if index_file.is_file() and index_file.name.endswith('.index'):
-            filename = index_file.name[:-6]
-            indexed_files.add(filename)
-    
+    indexed_files = _get_indexed_files()
+
+    # scandir 复用目录项里缓存的 stat 信息，避免每个文件多次 stat 系统调用
     files = []
-    for file_path in UPLOAD_DIR.iterdir():
-        if file_path.is_file():
-            files.append({
-                "filename": file_path.name,
-                "size": file_path.stat().st_size,
-                "type": file_path.suffix,
-                "indexed": file_path.name in indexed_files
-            })
-    return JSONResponse({"files": files})
+    with os.scandir(UPLOAD_DIR) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                stat_result = entry.stat()
+                files.append({
+                    "filename": entry.name,
+                    "size": stat_result.st_size,
+                    "type": Path(entry.name).suffix,
+                    "indexed": entry.name in indexed_files
+                })
+    return ORJSONResponse({"files": files})
 
 
 @app.delete("/uploads/{filename}")
@@ -316,13 +540,17 @@ async def delete_file(filename: str):
         index_file = INDEX_DIR / f"{filename}.index"
         if index_file.exists():
             index_file.unlink()
-        print(f"文件删除成功: {filename}")
-        return JSONResponse({
+        # 删除元信息文件
+        meta_file = META_DIR / f"{filename}.json"
+        if meta_file.exists():
+            meta_file.unlink()
+        log.info(f"文件删除成功: {filename}")
+        return ORJSONResponse({
             "message": "文件删除成功",
             "filename": filename
         })
     except Exception as e:
-        print(f"文件删除失败: {str(e)}")
+        log.error(f"文件删除失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"文件删除失败: {str(e)}")
 
 
@@ -342,26 +570,34 @@ async def delete_files(request: dict):
         index_file = INDEX_DIR / f"{filename}.index"
         
         try:
-            # 先从向量存储中删除该文件的文档
-            vector_store.delete_documents_by_source(filename)
+            # 先从向量存储中删除该文件的文档（重建索引阻塞，放到线程池）
+            await run_in_threadpool(vector_store.delete_documents_by_source, filename)
             
             # 删除索引标记文件
             if index_file.exists():
                 index_file.unlink()
-                print(f"索引删除成功: {filename}")
-            
+                log.info(f"索引删除成功: {filename}")
+
+            # 删除元信息文件
+            meta_file = META_DIR / f"{filename}.json"
+            if meta_file.exists():
+                meta_file.unlink()
+
             # 再删除实际文件
             if file_path.exists() and file_path.is_file():
                 file_path.unlink()
                 deleted_files.append(filename)
-                print(f"文件删除成功: {filename}")
+                log.info(f"文件删除成功: {filename}")
             else:
                 failed_files.append({"filename": filename, "error": "文件不存在"})
         except Exception as e:
             failed_files.append({"filename": filename, "error": str(e)})
-            print(f"文件删除失败: {filename}, 错误: {str(e)}")
+            log.error(f"文件删除失败: {filename}, 错误: {str(e)}")
     
-    return JSONResponse({
+    if deleted_files:
+        _clear_chat_cache()
+
+    return ORJSONResponse({
         "message": f"成功删除 {len(deleted_files)} 个文件",
         "deleted_files": deleted_files,
         "failed_files": failed_files
@@ -371,14 +607,14 @@ async def delete_files(request: dict):
 @app.get("/ollama/status")
 async def get_ollama_status():
     """获取 Ollama 服务状态"""
-    if ollama_client.is_available():
-        models = ollama_client.list_models()
-        return JSONResponse({
+    if await ollama_client.is_available():
+        models = await ollama_client.list_models()
+        return ORJSONResponse({
             "status": "connected",
             "models": models
         })
     else:
-        return JSONResponse({
+        return ORJSONResponse({
             "status": "disconnected",
             "models": [],
             "error": "Ollama 服务未运行"
@@ -389,7 +625,7 @@ async def get_ollama_status():
 async def get_available_models():
     """获取可用的模型列表"""
     from rag.ollama_client import AVAILABLE_MODELS
-    return JSONResponse({
+    return ORJSONResponse({
         "models": AVAILABLE_MODELS
     })
 
@@ -402,14 +638,18 @@ async def get_rag_methods():
         methods.append({
             "id": key,
             "name": method.description,
-            "class_name": method.__class__.__name__
+            "class_name": method.__name__
         })
-    return JSONResponse({
+    return ORJSONResponse({
         "methods": methods,
         "count": len(methods)
     })
 
 
+# SPA 挂载在所有 API 路由之后，首页由 StaticFiles 直接用 sendfile 零拷贝返回
+app.mount("/", StaticFiles(directory="static", html=True), name="spa")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -7,6 +7,7 @@
 """
 
 import os
+import httpx
 from pathlib import Path
 from typing import List, Optional, Generator, Dict, Any
 from dotenv import load_dotenv
@@ -14,6 +15,29 @@ from dotenv import load_dotenv
 # 加载环境变量
 load_dotenv()
 
+# SSE 帧解析用 orjson（C 实现），未安装时退回标准库
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
+
+# 共享的 HTTP/2 客户端（单条连接多路复用并发请求，省掉重复 TCP+TLS 握手）
+_http_client: Optional[httpx.Client] = None
+
+
+def _get_http_client() -> httpx.Client:
+    """获取共享的 httpx.Client"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=10),
+            timeout=httpx.Timeout(120, connect=10)
+        )
+    return _http_client
+
 
 class DeepSeekClient:
     """DeepSeek API 客户端"""
@@ -23,16 +47,29 @@ class DeepSeekClient:
         self.base_url = base_url or os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
         self.chat_model = os.getenv("DEEPSEEK_CHAT_MODEL", "deepseek-chat")
         self.reasoner_model = os.getenv("DEEPSEEK_REASONER_MODEL", "deepseek-reasoner")
-        
+        self._http = _get_http_client()
+
         if not self.api_key:
             raise ValueError("DeepSeek API key 未设置，请在 .env 文件中配置 DEEPSEEK_API_KEY")
-    
+
+    def close(self):
+        """关闭共享连接池（进程退出前调用）"""
+        global _http_client
+        if _http_client is not None and not _http_client.is_closed:
+            _http_client.close()
+        _http_client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def is_available(self) -> bool:
         """检查 API 是否可用"""
         try:
-            import requests
             # 使用 /chat/completions 端点测试
-            response = requests.post(
+            response = self._http.post(
                 f"{self.base_url}/chat/completions",
                 json={
                     "model": self.chat_model,
@@ -49,15 +86,13 @@ class DeepSeekClient:
     
     def _make_request(self, endpoint: str, data: dict) -> dict:
         """发起 API 请求"""
-        import requests
-        
         url = f"{self.base_url}{endpoint}"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
-        response = requests.post(url, json=data, headers=headers, timeout=120)
+
+        response = self._http.post(url, json=data, headers=headers)
         
         if response.status_code != 200:
             error_msg = response.json().get("error", {}).get("message", response.text)
@@ -69,40 +104,48 @@ class DeepSeekClient:
 class DeepSeekChat:
     """DeepSeek 对话模型 (deepseek-chat)"""
     
+    # 系统提示 - 要求用中文
+    _SYSTEM_PROMPT = "你是一个智能助手，请始终用中文回答用户的问题。"
+
     def __init__(self, model_name: str = None):
         self.client = DeepSeekClient()
         self.model_name = model_name or self.client.chat_model
-    
+        # 无上下文是最常见的调用路径，预先构好固定部分，省掉每次拼接
+        self._base_system_msg = {"role": "system", "content": self._SYSTEM_PROMPT}
+        self._base_payload_template = {"model": self.model_name, "stream": False}
+
     def chat(self, message: str, context: str = None, stream: bool = False) -> str:
         """发送对话消息
-        
+
         Args:
             message: 用户消息
             context: 上下文信息（用于 RAG）
             stream: 是否流式输出
-        
+
         Returns:
             AI 回复内容
         """
-        messages = []
-        
-        # 添加系统提示 - 要求用中文
-        system_prompt = "你是一个智能助手，请始终用中文回答用户的问题。"
-        
         if context:
-            system_prompt += f"\n\n请根据以下上下文信息回答用户的问题。如果上下文中没有相关信息，再基于你的知识回答。\n\n上下文：\n{context}"
-        
-        messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": message})
-        
+            system_msg = {
+                "role": "system",
+                "content": (
+                    f"{self._SYSTEM_PROMPT}\n\n"
+                    f"请根据以下上下文信息回答用户的问题。如果上下文中没有相关信息，"
+                    f"再基于你的知识回答。\n\n上下文：\n{context}"
+                )
+            }
+        else:
+            system_msg = self._base_system_msg
+
         data = {
-            "model": self.model_name,
-            "messages": messages,
-            "stream": stream
+            **self._base_payload_template,
+            "messages": [system_msg, {"role": "user", "content": message}]
         }
-        
+        if stream:
+            data["stream"] = True
+
         response = self.client._make_request("/chat/completions", data)
-        
+
         return response["choices"][0]["message"]["content"]
     
     def chat_stream(self, message: str, context: str = None) -> Generator[str, None, None]:
@@ -123,27 +166,28 @@ class DeepSeekChat:
             "stream": True
         }
         
-        import requests
-        
         url = f"{self.client.base_url}/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.client.api_key}",
             "Content-Type": "application/json"
         }
-        
-        response = requests.post(url, json=data, headers=headers, stream=True, timeout=120)
-        
-        for line in response.iter_lines():
-            if line:
-                line = line.decode('utf-8')
-                if line.startswith('data: '):
-                    data = line[6:]
-                    if data != '[DONE]':
-                        import json
-                        chunk = json.loads(data)
-                        content = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                        if content:
-                            yield content
+
+        # httpx 在 HTTP/2 上原生流式；局部变量绑定省掉循环内查找
+        loads = _loads
+        prefix = 'data: '
+        done = '[DONE]'
+
+        with self.client._http.stream("POST", url, json=data, headers=headers) as response:
+            for line in response.iter_lines():
+                if not line or not line.startswith(prefix):
+                    continue
+                payload = line[6:]
+                if payload == done:
+                    break
+                chunk = loads(payload)
+                content = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                if content:
+                    yield content
 
 
 class DeepSeekReasoner:
@@ -230,7 +274,8 @@ class DeepSeekEmbedding:
     
     def embed_batch(self, texts: List[str]) -> List[List[float]]:
         """批量生成嵌入"""
-        return [self.embed(text) for text in texts if self.embed(text)]
+        # 生成器里只调用一次 embed，避免条件判断再调一遍（双倍耗时/计费）
+        return [vec for vec in (self.embed(text) for text in texts) if vec]
 
 
 # 便捷函数
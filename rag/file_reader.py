@@ -7,9 +7,44 @@
 - xls, xlsx (Excel文档)
 """
 
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
+
+
+# 预编译的正则（clean_text / 表格格式化按单元格高频调用）
+_RE_HSPACE = re.compile(r'[ \t]+')
+_RE_WS = re.compile(r'\s+')
+
+# 乱码字符（U+FFFD）和控制字符（保留 \t\n\r），translate 单遍 C 扫描删除
+_CTRL_TABLE = str.maketrans('', '', '�' + ''.join(
+    chr(c) for c in range(0x20) if c not in (0x09, 0x0a, 0x0d)
+) + '\x7f')
+
+# PDF 页面提取进程池（懒初始化，未处理 PDF 时不创建子进程）
+_PDF_POOL = None
+
+# 页数低于该值时进程池开销得不偿失，直接在当前进程提取
+_PDF_POOL_MIN_PAGES = 4
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """获取 PDF 页面提取进程池"""
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        _PDF_POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _PDF_POOL
+
+
+def _extract_pdf_page_text(path_str: str, page_index: int) -> str:
+    """提取 PDF 单页文本（可在子进程中执行）"""
+    import PyPDF2
+    with open(path_str, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        return reader.pages[page_index].extract_text() or ""
 
 
 def extract_text_from_file(file_path: Path) -> Optional[str]:
@@ -37,6 +72,34 @@ def extract_text_from_file(file_path: Path) -> Optional[str]:
         return None
 
 
+def extract_texts(paths: List[Path], workers: Optional[int] = None) -> List[Optional[str]]:
+    """并行提取多个文件的文本内容
+
+    单个文件的解析（PDF/DOCX/XLSX）是 CPU 密集的，批量导入目录时
+    按文件分发到进程池，N 个文件不再串行占用单核。
+
+    Args:
+        paths: 文件路径列表
+        workers: 进程数，默认取 CPU 核数
+
+    Returns:
+        与 paths 对齐的文本列表，提取失败的项为 None
+    """
+    if not paths:
+        return []
+    # 单个文件时进程池开销得不偿失
+    if len(paths) == 1:
+        return [extract_text_from_file(Path(paths[0]))]
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        # chunksize 摊薄任务分发和 pickle 开销
+        return list(executor.map(
+            extract_text_from_file,
+            [Path(p) for p in paths],
+            chunksize=4
+        ))
+
+
 def clean_text(content: str) -> str:
     """
     清洗文本中的乱码和无效字符
@@ -50,32 +113,53 @@ def clean_text(content: str) -> str:
     if not content:
         return content
     
-    # 替换常见的乱码字符（ Replacement Character U+FFFD）
-    content = content.replace('\ufffd', '')
-    
-    # 移除控制字符（保留换行符\t）
-    content = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', content)
+    # 移除常见乱码字符（Replacement Character U+FFFD）和控制字符（保留换行符\t）
+    # translate 是单遍 C 扫描，免去逐个正则替换
+    content = content.translate(_CTRL_TABLE)
     
     # 替换多个连续空白字符为单个空格（保留换行）
-    content = re.sub(r'[ \t]+', ' ', content)
-    
-    # 移除每行开头和结尾的空白
-    lines = [line.strip() for line in content.split('\n')]
-    # 过滤空行
-    lines = [line for line in lines if line]
-    content = '\n'.join(lines)
+    content = _RE_HSPACE.sub(' ', content)
     
+    # 单遍完成去除行首尾空白 + 过滤空行，不再物化两个中间列表
+    content = '\n'.join(
+        stripped
+        for stripped in (line.strip() for line in content.split('\n'))
+        if stripped
+    )
+
     return content
 
 
 def _extract_text_from_txt(file_path: Path) -> Optional[str]:
     """从 txt/md 文件提取文本"""
+    try:
+        raw = file_path.read_bytes()
+    except Exception as e:
+        print(f"读取文件失败: {file_path.name}, 错误: {str(e)}")
+        return None
+
+    # 优先用 charset-normalizer 一次性检测编码，避免逐个编码反复全文件解码
+    try:
+        import charset_normalizer
+    except ImportError:
+        charset_normalizer = None
+
+    if charset_normalizer is not None:
+        best = charset_normalizer.from_bytes(raw).best()
+        if best is not None:
+            print(f"检测到 {best.encoding} 编码: {file_path.name}")
+            content = clean_text(raw.decode(best.encoding, errors='replace'))
+            print(f"内容预览:\n{content[:1000]}...")
+            return content
+        # 检测不出编码时走下方的逐个编码尝试
+        print(f"编码检测失败，回退到逐个编码尝试: {file_path.name}")
+
+    # 回退：逐个尝试常见编码
     encodings = ['utf-8', 'gbk', 'gb2312', 'iso-8859-1', 'latin-1']
-    
+
     for encoding in encodings:
         try:
-            with file_path.open('r', encoding=encoding) as f:
-                content = f.read()
+            content = raw.decode(encoding)
             print(f"使用 {encoding} 编码成功读取文件: {file_path.name}")
             content = clean_text(content)
             print(f"内容预览:\n{content[:1000]}...")
@@ -85,7 +169,7 @@ def _extract_text_from_txt(file_path: Path) -> Optional[str]:
         except Exception as e:
             print(f"使用 {encoding} 编码读取失败: {str(e)}")
             continue
-    
+
     print(f"无法读取文件内容: {file_path.name}")
     return None
 
@@ -96,56 +180,104 @@ def _extract_text_from_pdf(file_path: Path) -> Optional[str]:
     table_content = []
     
     try:
-        import PyPDF2
-        with file_path.open('rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            for i, page in enumerate(reader.pages):
-                # 提取普通文本
-                text = page.extract_text()
-                if text:
-                    text_content.append(text)
-                
-                # 尝试使用 pdfplumber 提取表格（发票等表格文档）
+        # 优先使用 PyMuPDF（MuPDF C 库），一次打开同时取文本和表格，
+        # 省掉 pdfplumber 对整份文档的第二次解析
+        tables_supported = False
+        try:
+            import fitz
+            with fitz.open(str(file_path)) as doc:
+                num_pages = doc.page_count
+                for i, page in enumerate(doc):
+                    text = page.get_text("text")
+                    if text:
+                        text_content.append(text)
+                    try:
+                        for table in page.find_tables().tables:
+                            table_str = _format_table(table.extract())
+                            if table_str:
+                                table_content.append(f"[表格区域]\n{table_str}")
+                                print(f"第 {i+1} 页发现表格")
+                    except Exception as e:
+                        print(f"PyMuPDF 提取表格失败（{file_path.name} 第 {i+1} 页）: {str(e)}")
+            tables_supported = True
+        except ImportError:
+            # 回退到 pypdfium2（C++ 实现，解析快、内存占用低）
+            try:
+                import pypdfium2 as pdfium
+                pdf = pdfium.PdfDocument(str(file_path))
                 try:
-                    import pdfplumber
-                    with pdfplumber.open(file_path) as pdf:
-                        if i < len(pdf.pages):
-                            page_obj = pdf.pages[i]
+                    num_pages = len(pdf)
+                    for page in pdf:
+                        text = page.get_textpage().get_text_range()
+                        if text:
+                            text_content.append(text)
+                finally:
+                    pdf.close()
+            except ImportError:
+                # 再回退到 PyPDF2
+                import PyPDF2
+                with file_path.open('rb') as f:
+                    reader = PyPDF2.PdfReader(f)
+                    num_pages = len(reader.pages)
+
+                # 多页文档按页并行提取文本，单核解析大 PDF 太慢
+                if num_pages >= _PDF_POOL_MIN_PAGES:
+                    pool = _get_pdf_pool()
+                    page_texts = list(pool.map(
+                        partial(_extract_pdf_page_text, str(file_path)),
+                        range(num_pages)
+                    ))
+                else:
+                    page_texts = [_extract_pdf_page_text(str(file_path), i) for i in range(num_pages)]
+
+                for text in page_texts:
+                    if text:
+                        text_content.append(text)
+
+            # 无 PyMuPDF 时用 pdfplumber 提取表格（发票等表格文档）
+            # 整份文档只打开一次，按页复用解析好的对象树
+            try:
+                import pdfplumber
+                with pdfplumber.open(file_path) as pdf:
+                    for i, page_obj in enumerate(pdf.pages):
+                        try:
                             tables = page_obj.extract_tables()
-                            if tables:
-                                for table in tables:
-                                    table_str = _format_table(table)
-                                    if table_str:
-                                        table_content.append(f"[表格区域]\n{table_str}")
-                                        print(f"第 {i+1} 页发现表格")
-                    pdfplumber_available = True
-                except ImportError:
-                    pdfplumber_available = False
-                except Exception as e:
-                    pdfplumber_available = False
-                    print(f"pdfplumber 提取表格失败（{file_path.name}）: {str(e)}")
-            
-            # 合并文本和表格内容
-            all_content = []
-            if text_content:
-                all_content.append('\n'.join(text_content))
-            if table_content:
-                all_content.append('\n\n'.join(table_content))
-            
-            content = '\n\n'.join(all_content)
-            content = clean_text(content)
-            
-            if pdfplumber_available:
-                print(f"成功提取 PDF 文本内容（含表格）: {file_path.name}, 共 {len(reader.pages)} 页")
-            else:
-                print(f"成功提取 PDF 文本内容: {file_path.name}, 共 {len(reader.pages)} 页")
-                print("提示：安装 pdfplumber 可支持表格识别（pip install pdfplumber）")
-            
-            print(f"内容预览:\n{content[:1000]}...")
-            return content
-            
+                        except Exception as e:
+                            print(f"pdfplumber 提取表格失败（{file_path.name} 第 {i+1} 页）: {str(e)}")
+                            continue
+                        if tables:
+                            for table in tables:
+                                table_str = _format_table(table)
+                                if table_str:
+                                    table_content.append(f"[表格区域]\n{table_str}")
+                                    print(f"第 {i+1} 页发现表格")
+                tables_supported = True
+            except ImportError:
+                pass
+            except Exception as e:
+                print(f"pdfplumber 提取表格失败（{file_path.name}）: {str(e)}")
+
+        # 合并文本和表格内容
+        all_content = []
+        if text_content:
+            all_content.append('\n'.join(text_content))
+        if table_content:
+            all_content.append('\n\n'.join(table_content))
+
+        content = '\n\n'.join(all_content)
+        content = clean_text(content)
+
+        if tables_supported:
+            print(f"成功提取 PDF 文本内容（含表格）: {file_path.name}, 共 {num_pages} 页")
+        else:
+            print(f"成功提取 PDF 文本内容: {file_path.name}, 共 {num_pages} 页")
+            print("提示：安装 PyMuPDF 或 pdfplumber 可支持表格识别")
+
+        print(f"内容预览:\n{content[:1000]}...")
+        return content
+
     except ImportError:
-        print("PyPDF2 未安装，无法提取 PDF 内容")
+        print("pypdfium2/PyPDF2 均未安装，无法提取 PDF 内容")
         return None
     except Exception as e:
         print(f"提取 PDF 内容失败: {str(e)}")
@@ -167,7 +299,7 @@ def _format_table(table: list) -> str:
                     cleaned_row.append("")
                 else:
                     cell_str = str(cell).strip()
-                    cell_str = re.sub(r'\s+', ' ', cell_str)
+                    cell_str = _RE_WS.sub(' ', cell_str)
                     cleaned_row.append(cell_str)
             lines.append(' | '.join(cleaned_row))
     
@@ -221,20 +353,95 @@ def _extract_text_from_doc(file_path: Path) -> Optional[str]:
 
 def _format_docx_table(table) -> str:
     """格式化 Word 表格内容"""
+    # table._cells 一次性取出扁平的单元格列表；合并单元格在其中是同一
+    # 对象重复出现，按对象缓存清洗结果，避免对同一段 XML 反复取 text
+    cells = table._cells
+    ncols = len(table.columns)
+    if ncols == 0:
+        return ""
+    cleaned = {}
+
+    def _cell_text(cell):
+        key = id(cell)
+        if key not in cleaned:
+            cleaned[key] = _RE_WS.sub(' ', cell.text).strip()
+        return cleaned[key]
+
     lines = []
-    for row in table.rows:
-        row_data = []
-        for cell in row.cells:
-            cell_text = cell.text.strip()
-            cell_text = re.sub(r'\s+', ' ', cell_text)
-            row_data.append(cell_text)
-        if any(row_data):  # 只添加非空行
-            lines.append(' | '.join(row_data))
+    for start in range(0, len(cells), ncols):
+        joined = ' | '.join(_cell_text(cell) for cell in cells[start:start + ncols])
+        if joined.strip(' |'):  # 只添加非空行
+            lines.append(joined)
     return '\n'.join(lines)
 
 
+def _format_xlsx_row(row) -> str:
+    """把 openpyxl 的一行值格式化为 ' | ' 连接的文本，空行返回空串"""
+    row_data = [
+        "" if val is None else (f"{val:.2f}" if isinstance(val, float) else str(val))
+        for val in row
+    ]
+    return ' | '.join(row_data) if any(row_data) else ""
+
+
 def _extract_text_from_excel(file_path: Path) -> Optional[str]:
     """从 Excel 文件提取文本（含表格）"""
+    # 优先用 python-calamine（Rust 解析器），直接返回原生 Python 值，
+    # 跳过 pandas 的类型推断和 DataFrame 物化，.xls/.xlsx 通吃
+    try:
+        from python_calamine import CalamineWorkbook
+        wb = CalamineWorkbook.from_path(str(file_path))
+        all_content = []
+        for sheet_name in wb.sheet_names:
+            all_content.append(f"[工作表: {sheet_name}]")
+            for row in wb.get_sheet_by_name(sheet_name).to_python():
+                formatted = _format_xlsx_row(row)
+                if formatted:
+                    all_content.append(formatted)
+            all_content.append("")  # 空行分隔
+
+        content = clean_text('\n'.join(all_content))
+
+        print(f"成功提取 Excel 内容: {file_path.name}, 共 {len(wb.sheet_names)} 个工作表")
+        print(f"内容预览:\n{content[:1000]}...")
+        return content
+    except ImportError:
+        pass
+    except Exception as e:
+        print(f"calamine 提取失败，回退到 openpyxl/pandas: {str(e)}")
+
+    # .xlsx 用 openpyxl 只读模式流式遍历，整表不进内存，
+    # 也绕开 pandas 对每个单元格的装箱开销
+    if file_path.suffix.lower() == '.xlsx':
+        try:
+            import openpyxl
+            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            all_content = []
+            sheet_count = 0
+            try:
+                for ws in wb.worksheets:
+                    sheet_count += 1
+                    all_content.append(f"[工作表: {ws.title}]")
+                    for row in ws.iter_rows(values_only=True):
+                        formatted = _format_xlsx_row(row)
+                        if formatted:
+                            all_content.append(formatted)
+                    all_content.append("")  # 空行分隔
+            finally:
+                wb.close()
+
+            content = '\n'.join(all_content)
+            content = clean_text(content)
+
+            print(f"成功提取 Excel 内容: {file_path.name}, 共 {sheet_count} 个工作表")
+            print(f"内容预览:\n{content[:1000]}...")
+            return content
+        except ImportError:
+            print("openpyxl 未安装，回退到 pandas 读取")
+        except Exception as e:
+            print(f"openpyxl 提取失败，回退到 pandas: {str(e)}")
+
+    # .xls 或 openpyxl 不可用时走 pandas
     try:
         import pandas as pd
         
@@ -254,18 +461,16 @@ def _extract_text_from_excel(file_path: Path) -> Optional[str]:
                 headers = df.columns.tolist()
                 header_line = ' | '.join(str(h) for h in headers)
                 all_content.append(header_line)
-                
-                # 处理数据行
-                for _, row in df.iterrows():
-                    row_data = []
-                    for val in row:
-                        if pd.isna(val):
-                            row_data.append("")
-                        elif isinstance(val, float):
-                            row_data.append(f"{val:.2f}")
-                        else:
-                            row_data.append(str(val))
-                    all_content.append(' | '.join(row_data))
+
+                # 处理数据行：列级向量化格式化后整行 join，
+                # 避免 iterrows 逐格跨越 Python 对象边界
+                formatted = df.astype(object).where(df.notna(), '')
+                for col in df.select_dtypes(include='float').columns:
+                    formatted[col] = df[col].map(
+                        lambda v: '' if pd.isna(v) else f"{v:.2f}"
+                    )
+                lines = formatted.astype(str).agg(' | '.join, axis=1)
+                all_content.extend(lines.tolist())
             
             all_content.append("")  # 空行分隔
         
@@ -6,36 +6,112 @@
 - OCR 模型：用于图像文字识别
 """
 
+import asyncio
+import base64
+import functools
+import hashlib
 import json
+import mmap
+import os
+import sqlite3
+import threading
+import httpx
+import numpy as np
 import requests
-from typing import List, Optional, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Optional, Tuple, Union
 from pathlib import Path
 
 
+# 大负载的 JSON 编码优先用 orjson（C 实现），未安装时退回标准库
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+
 # Ollama 默认配置
 DEFAULT_BASE_URL = "http://localhost:11434"
 
+# 模型常驻内存时长提示：空闲卸载后下次请求要付多秒的重新加载成本
+DEFAULT_KEEP_ALIVE = "30m"
+
+# 让 Ollama 用满 CPU 线程并整批调度 token
+_OLLAMA_OPTIONS = {"num_thread": os.cpu_count(), "num_batch": 512}
+
+# 共享的同步 Session（连接池 + 重试，所有模型封装复用同一个）
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """获取共享的 requests.Session"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=20,
+            pool_maxsize=100,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.2,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+# 共享的异步 HTTP 客户端（keep-alive 连接复用，懒初始化）
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """获取共享的 httpx.AsyncClient"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=60,
+            limits=httpx.Limits(max_keepalive_connections=32)
+        )
+    return _async_client
+
+
+async def close_async_client():
+    """关闭共享客户端（服务停机时调用）"""
+    global _async_client
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+
 
 class OllamaClient:
-    """Ollama 客户端"""
-    
+    """Ollama 客户端（异步，复用共享连接池）"""
+
     def __init__(self, base_url: str = DEFAULT_BASE_URL):
         self.base_url = base_url
         self.api_url = f"{base_url}/api"
-    
-    def is_available(self) -> bool:
+
+    async def is_available(self) -> bool:
         """检查 Ollama 服务是否可用"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            client = get_async_client()
+            response = await client.get(f"{self.base_url}/api/tags", timeout=5)
             return response.status_code == 200
         except Exception as e:
             print(f"Ollama 服务不可用: {str(e)}")
             return False
-    
-    def list_models(self) -> List[str]:
+
+    async def list_models(self) -> List[str]:
         """列出所有可用的模型"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=10)
+            client = get_async_client()
+            response = await client.get(f"{self.base_url}/api/tags", timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 return [model["name"] for model in data.get("models", [])]
@@ -43,14 +119,14 @@ class OllamaClient:
         except Exception as e:
             print(f"获取模型列表失败: {str(e)}")
             return []
-    
-    def pull_model(self, model_name: str) -> bool:
+
+    async def pull_model(self, model_name: str) -> bool:
         """拉取模型"""
         try:
-            response = requests.post(
+            client = get_async_client()
+            response = await client.post(
                 f"{self.api_url}/pull",
                 json={"name": model_name},
-                stream=True,
                 timeout=300
             )
             return response.status_code == 200
@@ -59,22 +135,415 @@ class OllamaClient:
             return False
 
 
+class EmbeddingCache:
+    """嵌入结果持久缓存
+
+    按 (model, 文本 SHA-256) 存储于 SQLite，外加一层进程内 LRU 热缓存。
+    嵌入对同一 (模型, 文本) 是确定性的，命中即可省掉整次推理和网络往返。
+    """
+
+    # SQLite 单条语句的变量上限是 999，查询按批切分
+    _SELECT_BATCH = 500
+
+    def __init__(self, cache_path: Path, hot_size: int = 4096):
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "model TEXT, sha256 BLOB, vec BLOB, dtype TEXT DEFAULT 'float32', "
+            "PRIMARY KEY (model, sha256))"
+        )
+        # 旧库没有 dtype 列时就地迁移
+        try:
+            self._conn.execute(
+                "ALTER TABLE embedding_cache ADD COLUMN dtype TEXT DEFAULT 'float32'"
+            )
+        except sqlite3.OperationalError:
+            pass
+        self._lock = threading.Lock()
+        self._hot: OrderedDict = OrderedDict()
+        self._hot_size = hot_size
+
+    def _put_hot(self, key: tuple, vec: List[float]):
+        self._hot[key] = vec
+        self._hot.move_to_end(key)
+        if len(self._hot) > self._hot_size:
+            self._hot.popitem(last=False)
+
+    def get_many(self, model: str, digests: List[bytes]) -> dict:
+        """批量查询缓存，返回 {digest: 向量}"""
+        found = {}
+        db_misses = []
+        with self._lock:
+            for digest in digests:
+                key = (model, digest)
+                if key in self._hot:
+                    self._hot.move_to_end(key)
+                    found[digest] = self._hot[key]
+                else:
+                    db_misses.append(digest)
+
+            for start in range(0, len(db_misses), self._SELECT_BATCH):
+                batch = db_misses[start:start + self._SELECT_BATCH]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT sha256, vec, dtype FROM embedding_cache "
+                    f"WHERE model = ? AND sha256 IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for digest, blob, dtype in rows:
+                    vec = np.frombuffer(
+                        blob, dtype=np.dtype(dtype or 'float32')
+                    ).astype(np.float32, copy=False).tolist()
+                    found[digest] = vec
+                    self._put_hot((model, digest), vec)
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[bytes, List[float]]],
+                 quantize: bool = True):
+        """批量写入缓存，items 为 [(digest, 向量), ...]
+
+        quantize=True 时以 float16 落盘，4096 维向量从 16KB 减到 8KB；
+        嵌入相似度按点积计算，对 fp16 舍入不敏感
+        """
+        if not items:
+            return
+        store_dtype = np.float16 if quantize else np.float32
+        dtype_name = 'float16' if quantize else 'float32'
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, sha256, vec, dtype) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (model, digest,
+                     np.asarray(vec, dtype=np.float32).astype(store_dtype).tobytes(),
+                     dtype_name)
+                    for digest, vec in items
+                ]
+            )
+            self._conn.commit()
+            for digest, vec in items:
+                self._put_hot((model, digest), list(vec))
+
+
+class SemanticCache:
+    """语义缓存（随机投影 LSH + 余弦相似度校验）
+
+    近似重复的问题（如"天空为什么是蓝色"和"为什么天空是蓝色的？"）
+    字符串不同但语义向量几乎一致，精确哈希缓存无法命中。
+    这里用 k 个随机超平面给查询向量做签名分桶，查询时只对
+    本桶和翻转单个超平面的相邻桶里的候选做一次点积排序，
+    余弦相似度达到阈值即视为命中。
+
+    向量以 int8 + 每向量缩放因子存储：内存占用降到 float32 的
+    1/4，余弦校验用 int32 累加点积再乘回缩放，精度损失可忽略。
+    """
+
+    def __init__(self, planes: int = 16, max_size: int = 512, threshold: float = 0.95):
+        self._planes = planes
+        self._max_size = max_size
+        self._threshold = threshold
+        self._proj: Optional[np.ndarray] = None
+        # id -> (int8 向量, 缩放因子, 载荷, 签名)，OrderedDict 顺序即 LRU 顺序
+        self._entries: OrderedDict = OrderedDict()
+        self._buckets: dict = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vec) -> Optional[np.ndarray]:
+        arr = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(arr)
+        if norm == 0:
+            return None
+        return arr / norm
+
+    def _bits(self, vec: np.ndarray) -> np.ndarray:
+        return vec @ self._proj > 0
+
+    @staticmethod
+    def _quantize(vec: np.ndarray) -> Tuple[np.ndarray, float]:
+        """按每向量最大绝对值缩放到 int8"""
+        scale = float(np.abs(vec).max()) / 127.0
+        if scale == 0:
+            scale = 1.0
+        return np.round(vec / scale).astype(np.int8), scale
+
+    def get(self, vec, threshold: Optional[float] = None):
+        """按语义相似度查询，未命中返回 None"""
+        normalized = self._normalize(vec)
+        if normalized is None:
+            return None
+        if threshold is None:
+            threshold = self._threshold
+
+        with self._lock:
+            if self._proj is None or not self._entries:
+                return None
+
+            # 候选 = 精确桶 + 翻转单个超平面的相邻桶
+            bits = self._bits(normalized)
+            candidate_ids = set()
+            candidate_ids.update(self._buckets.get(np.packbits(bits).tobytes(), ()))
+            for i in range(self._planes):
+                flipped = bits.copy()
+                flipped[i] = not flipped[i]
+                candidate_ids.update(self._buckets.get(np.packbits(flipped).tobytes(), ()))
+            if not candidate_ids:
+                return None
+
+            ids = list(candidate_ids)
+            quantized, q_scale = self._quantize(normalized)
+            matrix = np.stack([self._entries[entry_id][0] for entry_id in ids])
+            scales = np.array([self._entries[entry_id][1] for entry_id in ids],
+                              dtype=np.float32)
+            # int32 累加点积，再乘回双方缩放因子还原余弦值
+            scores = (matrix.astype(np.int32) @ quantized.astype(np.int32)) \
+                * (scales * q_scale)
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+            hit_id = ids[best]
+            self._entries.move_to_end(hit_id)
+            return self._entries[hit_id][2]
+
+    def put(self, vec, payload):
+        """写入缓存，超出容量时按 LRU 淘汰"""
+        normalized = self._normalize(vec)
+        if normalized is None:
+            return
+
+        with self._lock:
+            if self._proj is None:
+                rng = np.random.default_rng(0)
+                self._proj = rng.standard_normal(
+                    (normalized.shape[0], self._planes)
+                ).astype(np.float32)
+
+            signature = np.packbits(self._bits(normalized)).tobytes()
+            quantized, scale = self._quantize(normalized)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (quantized, scale, payload, signature)
+            self._buckets.setdefault(signature, set()).add(entry_id)
+
+            if len(self._entries) > self._max_size:
+                old_id, (_, _, _, old_sig) = self._entries.popitem(last=False)
+                bucket = self._buckets.get(old_sig)
+                if bucket is not None:
+                    bucket.discard(old_id)
+                    if not bucket:
+                        del self._buckets[old_sig]
+
+
+# 共享的嵌入缓存实例（懒初始化）
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """获取共享的嵌入缓存"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(Path("cache") / "embeddings.db")
+    return _embedding_cache
+
+
 class EmbeddingModel:
     """嵌入模型封装"""
-    
-    def __init__(self, model_name: str = "qwen3-embedding:8b", base_url: str = DEFAULT_BASE_URL):
+
+    def __init__(self, model_name: str = "qwen3-embedding:8b", base_url: str = DEFAULT_BASE_URL,
+                 batch_size: int = 64, quantize: bool = True,
+                 keep_alive: str = DEFAULT_KEEP_ALIVE, concurrency: int = 8):
         self.model_name = model_name
         self.base_url = base_url
+        self.batch_size = batch_size
+        # 子批次的并发请求上限（大批量摄取时多个子批次同时在途）
+        self.concurrency = concurrency
+        self.keep_alive = keep_alive
+        # 缓存落盘是否量化为 float16（减半磁盘和内存带宽）
+        self.quantize = quantize
         self.client = OllamaClient(base_url)
-    
+        self._session = get_session()
+        self._cache = get_embedding_cache()
+        # /api/embed 批量端点返回 404（旧版 Ollama）后降级为逐条请求
+        self._batch_api_available = True
+
     def embed(self, text: str) -> List[float]:
         """将单段文本转换为向量"""
+        embeddings = self.embed_batch([text])
+        return embeddings[0] if embeddings else []
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """批量将文本转换为向量
+
+        先查持久缓存，只把未命中的文本发给 Ollama；
+        网络路径优先走 /api/embed 批量端点
+        """
+        if not texts:
+            return []
+
+        digests = [hashlib.sha256(text.encode('utf-8')).digest() for text in texts]
+        cached = self._cache.get_many(self.model_name, digests)
+
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        miss_texts = []
+        miss_positions = []
+        for i, digest in enumerate(digests):
+            vec = cached.get(digest)
+            if vec is not None:
+                results[i] = vec
+            else:
+                miss_positions.append(i)
+                miss_texts.append(texts[i])
+
+        if miss_texts:
+            fresh = self._embed_batch_network(miss_texts)
+            to_store = []
+            for pos, vec in zip(miss_positions, fresh):
+                results[pos] = vec
+                if vec:
+                    to_store.append((digests[pos], vec))
+            self._cache.put_many(self.model_name, to_store, quantize=self.quantize)
+
+        return [vec for vec in results if vec]
+
+    async def embed_many(self, texts: List[str], concurrency: int = 16) -> List[List[float]]:
+        """并发批量嵌入（asyncio + 共享 httpx 客户端）
+
+        与 embed_batch 一样先查持久缓存，未命中的文本用信号量限流后
+        并发请求 Ollama，把串行排队的网络等待叠在一起
+        """
+        if not texts:
+            return []
+
+        digests = [hashlib.sha256(text.encode('utf-8')).digest() for text in texts]
+        cached = self._cache.get_many(self.model_name, digests)
+
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        miss_texts = []
+        miss_positions = []
+        for i, digest in enumerate(digests):
+            vec = cached.get(digest)
+            if vec is not None:
+                results[i] = vec
+            else:
+                miss_positions.append(i)
+                miss_texts.append(texts[i])
+
+        if miss_texts:
+            client = get_async_client()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def _embed_one(text: str) -> List[float]:
+                async with semaphore:
+                    try:
+                        response = await client.post(
+                            f"{self.base_url}/api/embeddings",
+                            json={
+                                "model": self.model_name,
+                                "prompt": text,
+                                "keep_alive": self.keep_alive
+                            },
+                            timeout=120
+                        )
+                        if response.status_code == 200:
+                            return response.json().get("embedding", [])
+                        print(f"嵌入失败: {response.text}")
+                        return []
+                    except Exception as e:
+                        print(f"嵌入请求失败: {str(e)}")
+                        return []
+
+            fresh = await asyncio.gather(*(_embed_one(text) for text in miss_texts))
+            to_store = []
+            for pos, vec in zip(miss_positions, fresh):
+                results[pos] = vec
+                if vec:
+                    to_store.append((digests[pos], vec))
+            self._cache.put_many(self.model_name, to_store, quantize=self.quantize)
+
+        return [vec for vec in results if vec]
+
+    def embed_many_sync(self, texts: List[str], concurrency: int = 16) -> List[List[float]]:
+        """embed_many 的同步入口（调用方没有事件循环时使用）"""
+        return asyncio.run(self.embed_many(texts, concurrency=concurrency))
+
+    def warmup(self):
+        """预热：发一次最小嵌入请求，把模型加载挪到启动阶段"""
+        self._embed_single("warmup")
+
+    def _embed_batch_network(self, texts: List[str]) -> List[List[float]]:
+        """通过 Ollama 批量嵌入，返回与输入对齐的向量列表（失败项为 []）
+
+        优先走 /api/embed 批量端点，一次请求嵌入整个子批次，
+        摊薄 HTTP 往返和模型调度开销；多个子批次用有界线程池并发
+        在途，大批量摄取时总耗时由串行求和降到最慢批次
+        """
+        if not self._batch_api_available:
+            return self._embed_each(texts)
+
+        if len(texts) <= self.batch_size:
+            return self._embed_sub_batch(texts)
+
+        # 按长度排序后切批：服务端按批内最长文本填充，长短混批会把
+        # 算力浪费在填充 token 上；排序让每个子批长度相近，
+        # 嵌入完再按原顺序还原
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        sub_batches = [
+            [texts[i] for i in order[start:start + self.batch_size]]
+            for start in range(0, len(order), self.batch_size)
+        ]
+
+        # executor.map 保序返回，先按排序后顺序收集再反排列
+        sorted_embeddings: List[List[float]] = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for batch_result in pool.map(self._embed_sub_batch, sub_batches):
+                sorted_embeddings.extend(batch_result)
+
+        embeddings: List[List[float]] = [[] for _ in texts]
+        for pos, vec in zip(order, sorted_embeddings):
+            embeddings[pos] = vec
+        return embeddings
+
+    def _embed_sub_batch(self, sub_batch: List[str]) -> List[List[float]]:
+        """嵌入单个子批次，返回与 sub_batch 对齐的向量列表"""
+        try:
+            response = self._session.post(
+                f"{self.base_url}/api/embed",
+                json={
+                    "model": self.model_name,
+                    "input": sub_batch,
+                    "keep_alive": self.keep_alive
+                },
+                timeout=300
+            )
+            if response.status_code == 404:
+                # 旧版 Ollama 没有批量端点
+                print("Ollama 不支持 /api/embed 批量端点，降级为逐条嵌入")
+                self._batch_api_available = False
+                return self._embed_each(sub_batch)
+            if response.status_code == 200:
+                data = response.json()
+                batch_embeddings = data.get("embeddings", [])
+                # 对齐补位（服务端异常少返回时）
+                batch_embeddings.extend([[]] * (len(sub_batch) - len(batch_embeddings)))
+                return batch_embeddings
+            print(f"批量嵌入失败: {response.text}")
+        except Exception as e:
+            print(f"批量嵌入请求失败: {str(e)}")
+        return [[] for _ in sub_batch]
+
+    def _embed_single(self, text: str) -> List[float]:
+        """通过旧版 /api/embeddings 端点嵌入单段文本"""
         try:
-            response = requests.post(
+            response = self._session.post(
                 f"{self.base_url}/api/embeddings",
                 json={
                     "model": self.model_name,
-                    "prompt": text
+                    "prompt": text,
+                    "keep_alive": self.keep_alive
                 },
                 timeout=60
             )
@@ -87,29 +556,59 @@ class EmbeddingModel:
         except Exception as e:
             print(f"嵌入请求失败: {str(e)}")
             return []
-    
-    def embed_batch(self, texts: List[str]) -> List[List[float]]:
-        """批量将文本转换为向量"""
+
+    def _embed_each(self, texts: List[str]) -> List[List[float]]:
+        """逐条嵌入（批量端点不可用时的回退路径），失败项为 []"""
         embeddings = []
         for text in texts:
-            embedding = self.embed(text)
-            if embedding:
-                embeddings.append(embedding)
-            else:
+            embedding = self._embed_single(text)
+            if not embedding:
                 print(f"文本嵌入失败: {text[:50]}...")
+            embeddings.append(embedding)
         return embeddings
 
 
 class ChatModel:
     """对话模型封装"""
     
-    def __init__(self, model_name: str = "llama3:latest", base_url: str = DEFAULT_BASE_URL):
+    def __init__(self, model_name: str = "llama3:latest", base_url: str = DEFAULT_BASE_URL,
+                 keep_alive: str = DEFAULT_KEEP_ALIVE):
         self.model_name = model_name
         self.base_url = base_url
+        self.keep_alive = keep_alive
         self.client = OllamaClient(base_url)
-    
+        self._session = get_session()
+        # 语义缓存：近似重复的问题直接复用已有回答，省掉整次生成
+        self._semantic_cache = SemanticCache()
+        self._cache_embedder: Optional["EmbeddingModel"] = None
+
+    # 超过该长度的消息不做语义缓存：拼进检索上下文的完整提示词
+    # 几乎每次都不同，探测命中率趋近于零，却要为每条多付一次
+    # 多 KB 文本的嵌入推理，且把一次性向量写进嵌入缓存白占空间
+    _SEMANTIC_CACHE_MAX_LEN = 512
+
+    def _query_vector(self, message: str) -> Optional[np.ndarray]:
+        """计算用于语义缓存查找的查询向量，失败返回 None"""
+        if len(message) > self._SEMANTIC_CACHE_MAX_LEN:
+            return None
+        try:
+            if self._cache_embedder is None:
+                self._cache_embedder = EmbeddingModel(base_url=self.base_url)
+            vec = self._cache_embedder.embed(message)
+            return np.asarray(vec, dtype=np.float32) if vec else None
+        except Exception:
+            return None
+
     def chat(self, message: str, context: Optional[str] = None) -> str:
         """发送对话消息"""
+        # 先查语义缓存（上下文必须逐字节一致才命中，避免串答案）
+        context_digest = hashlib.sha256((context or '').encode('utf-8')).digest()
+        query_vec = self._query_vector(message)
+        if query_vec is not None:
+            hit = self._semantic_cache.get(query_vec)
+            if hit is not None and hit[0] == context_digest:
+                return hit[1]
+
         try:
             messages = [{"role": "user", "content": message}]
             
@@ -135,10 +634,12 @@ class ChatModel:
             payload = {
                 "model": self.model_name,
                 "messages": messages,
-                "stream": False
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": _OLLAMA_OPTIONS
             }
             
-            response = requests.post(
+            response = self._session.post(
                 f"{self.base_url}/api/chat",
                 json=payload,
                 timeout=120
@@ -146,7 +647,10 @@ class ChatModel:
             
             if response.status_code == 200:
                 data = response.json()
-                return data.get("message", {}).get("content", "")
+                reply = data.get("message", {}).get("content", "")
+                if reply and query_vec is not None:
+                    self._semantic_cache.put(query_vec, (context_digest, reply))
+                return reply
             else:
                 print(f"对话失败: {response.text}")
                 return ""
@@ -154,19 +658,36 @@ class ChatModel:
             print(f"对话请求失败: {str(e)}")
             return ""
     
+    def warmup(self):
+        """预热：空消息请求只加载模型不生成，消除首次对话的冷启动"""
+        try:
+            self._session.post(
+                f"{self.base_url}/api/chat",
+                json={
+                    "model": self.model_name,
+                    "messages": [],
+                    "keep_alive": self.keep_alive
+                },
+                timeout=300
+            )
+        except Exception as e:
+            print(f"模型预热失败: {str(e)}")
+
     def chat_stream(self, message: str, context: Optional[str] = None):
         """流式对话"""
         try:
             payload = {
                 "model": self.model_name,
                 "messages": [{"role": "user", "content": message}],
-                "stream": True
+                "stream": True,
+                "keep_alive": self.keep_alive,
+                "options": _OLLAMA_OPTIONS
             }
             
             if context:
                 payload["system"] = f"根据以下上下文回答问题:\n\n{context}"
             
-            response = requests.post(
+            response = self._session.post(
                 f"{self.base_url}/api/chat",
                 json=payload,
                 stream=True,
@@ -211,10 +732,12 @@ class ChatModel:
                     {"role": "system", "content": "你是一个专业的文字润色助手，请用中文润色文本，保持原意，使语言更流畅自然。"},
                     {"role": "user", "content": prompt}
                 ],
-                "stream": False
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": _OLLAMA_OPTIONS
             }
             
-            response = requests.post(
+            response = self._session.post(
                 f"{self.base_url}/api/chat",
                 json=payload,
                 timeout=120
@@ -238,29 +761,39 @@ class ChatModel:
 class OCRModel:
     """OCR 模型封装"""
     
-    def __init__(self, model_name: str = "deepseek-ocr:latest", base_url: str = DEFAULT_BASE_URL):
+    def __init__(self, model_name: str = "deepseek-ocr:latest", base_url: str = DEFAULT_BASE_URL,
+                 keep_alive: str = DEFAULT_KEEP_ALIVE):
         self.model_name = model_name
         self.base_url = base_url
+        self.keep_alive = keep_alive
         self.client = OllamaClient(base_url)
+        self._session = get_session()
     
     def ocr(self, image_path: str) -> str:
         """识别图片中的文字"""
         try:
-            import base64
-            
-            # 读取图片并转为 base64
+            # mmap 读图避免整文件先读进内存再复制一次，base64 直接在映射上编码
             with open(image_path, "rb") as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
+                try:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        image_data = base64.b64encode(mapped).decode('ascii')
+                except ValueError:
+                    # 空文件无法 mmap
+                    image_data = base64.b64encode(f.read()).decode('ascii')
+
             payload = {
                 "model": self.model_name,
                 "prompt": "请识别图片中的所有文字，保持原有格式",
-                "images": [image_data]
+                "images": [image_data],
+                "keep_alive": self.keep_alive,
+                "options": _OLLAMA_OPTIONS
             }
-            
-            response = requests.post(
+
+            # 多 MB 的 base64 字符串用 orjson 序列化，绕开标准库的慢转义
+            response = self._session.post(
                 f"{self.base_url}/api/generate",
-                json=payload,
+                data=_dumps(payload),
+                headers={"Content-Type": "application/json"},
                 timeout=120
             )
             
@@ -278,10 +811,13 @@ class OCRModel:
 class ReasoningModel:
     """推理模型封装（DeepSeek R1 等）"""
     
-    def __init__(self, model_name: str = "deepseek-r1:8b", base_url: str = DEFAULT_BASE_URL):
+    def __init__(self, model_name: str = "deepseek-r1:8b", base_url: str = DEFAULT_BASE_URL,
+                 keep_alive: str = DEFAULT_KEEP_ALIVE):
         self.model_name = model_name
         self.base_url = base_url
+        self.keep_alive = keep_alive
         self.client = OllamaClient(base_url)
+        self._session = get_session()
     
     def reason(self, problem: str, context: Optional[str] = None) -> str:
         """推理问题"""
@@ -293,10 +829,12 @@ class ReasoningModel:
             payload = {
                 "model": self.model_name,
                 "prompt": prompt,
-                "stream": False
+                "stream": False,
+                "keep_alive": self.keep_alive,
+                "options": _OLLAMA_OPTIONS
             }
             
-            response = requests.post(
+            response = self._session.post(
                 f"{self.base_url}/api/generate",
                 json=payload,
                 timeout=300
@@ -341,6 +879,7 @@ AVAILABLE_MODELS = {
 }
 
 
+@functools.lru_cache(maxsize=None)
 def get_embedding_model(model_name: str = None) -> EmbeddingModel:
     """获取嵌入模型实例"""
     if model_name is None:
@@ -348,6 +887,7 @@ def get_embedding_model(model_name: str = None) -> EmbeddingModel:
     return EmbeddingModel(model_name)
 
 
+@functools.lru_cache(maxsize=None)
 def get_chat_model(model_name: str = None) -> ChatModel:
     """获取对话模型实例"""
     if model_name is None:
@@ -355,6 +895,7 @@ def get_chat_model(model_name: str = None) -> ChatModel:
     return ChatModel(model_name)
 
 
+@functools.lru_cache(maxsize=None)
 def get_ocr_model(model_name: str = None) -> OCRModel:
     """获取 OCR 模型实例"""
     if model_name is None:
@@ -362,6 +903,7 @@ def get_ocr_model(model_name: str = None) -> OCRModel:
     return OCRModel(model_name)
 
 
+@functools.lru_cache(maxsize=None)
 def get_reasoning_model(model_name: str = None) -> ReasoningModel:
     """获取推理模型实例"""
     if model_name is None:
@@ -370,19 +912,24 @@ def get_reasoning_model(model_name: str = None) -> ReasoningModel:
 
 
 if __name__ == "__main__":
-    # 测试 Ollama 连接
-    client = OllamaClient()
-    
-    print("=" * 50)
-    print("Ollama 模型管理工具")
-    print("=" * 50)
-    
-    if client.is_available():
-        print("✅ Ollama 服务已连接")
-        
-        models = client.list_models()
-        print(f"\n可用模型 ({len(models)} 个):")
-        for model in models:
-            print(f"  - {model}")
-    else:
-        print("❌ Ollama 服务未连接，请确保 Ollama 已启动")
\ No newline at end of file
+    async def _main():
+        # 测试 Ollama 连接
+        client = OllamaClient()
+
+        print("=" * 50)
+        print("Ollama 模型管理工具")
+        print("=" * 50)
+
+        if await client.is_available():
+            print("✅ Ollama 服务已连接")
+
+            models = await client.list_models()
+            print(f"\n可用模型 ({len(models)} 个):")
+            for model in models:
+                print(f"  - {model}")
+        else:
+            print("❌ Ollama 服务未连接，请确保 Ollama 已启动")
+
+        await close_async_client()
+
+    asyncio.run(_main())
\ No newline at end of file
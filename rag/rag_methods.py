@@ -1,151 +1,251 @@
 # -*- coding: utf-8 -*-
 """17 种 RAG 优化方法实现"""
 
+import asyncio
+import functools
+import json
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from typing import List, Dict, Optional, Tuple, Union
 from rag.ollama_client import (
-    get_embedding_model, 
+    SemanticCache,
+    get_embedding_model,
     get_chat_model,
     get_reasoning_model
 )
 
 
+# 整条 RAG 流水线的语义响应缓存：近似重复的问题（余弦 ≥ 0.97）
+# 直接复用完整结果，省掉检索 + 生成的全部开销；
+# 缓存条目绑定 (方法, polish, 索引大小)，索引增删后自然失效
+_response_cache = SemanticCache()
+_RESPONSE_CACHE_THRESHOLD = 0.97
+
+
+# 查询向量 LRU 缓存（进程内共享）：同一查询在多次 retrieve 之间
+# （SelfRAG 二次检索、QueryTransformation 变体循环等）只嵌入一次
+_query_vec_cache: OrderedDict = OrderedDict()
+_QUERY_VEC_CACHE_SIZE = 2048
+
+
+def _embed_query_cached(embedding_model, query: str) -> List[float]:
+    """带 LRU 缓存的查询嵌入"""
+    key = (embedding_model.model_name, query)
+    cached = _query_vec_cache.get(key)
+    if cached is not None:
+        _query_vec_cache.move_to_end(key)
+        return cached
+    vec = embedding_model.embed(query)
+    if vec:
+        _query_vec_cache[key] = vec
+        if len(_query_vec_cache) > _QUERY_VEC_CACHE_SIZE:
+            _query_vec_cache.popitem(last=False)
+    return vec
+
+
+def _dedup_sources(docs: List[Tuple[str, float, dict]]) -> List[str]:
+    """按出现顺序去重提取出处（dict 保序 + 哈希查找，免去 O(n²) 的列表查找）"""
+    return list(dict.fromkeys(
+        meta.get("source", "未知来源") for _doc, _score, meta in docs
+    ))
+
+
 class BaseRAGMethod:
     """RAG 方法基类"""
-    
+
     name: str = "base"
     description: str = ""
-    
+
+    # 默认检索条数（子类按需覆盖）
+    K = 5
+
+    # 全体方法共享的有界线程池：generate/reason/retrieve 都是对 Ollama 的
+    # I/O 等待，互不依赖的调用丢进来并行，省掉串行 HTTP 往返
+    _pool = ThreadPoolExecutor(max_workers=8)
+
     def __init__(self):
         self.embedding_model = get_embedding_model()
         self.chat_model = get_chat_model()
-    
+
     def retrieve(self, query: str, vector_store, k: int = 5) -> List[Tuple[str, float, dict]]:
-        """检索相关文档"""
+        """检索相关文档（查询向量走 LRU 缓存，避免重复嵌入）"""
+        vec = _embed_query_cached(self.embedding_model, query)
+        if vec:
+            return vector_store.search_by_vector(vec, k=k)
         return vector_store.search(query, k=k)
     
+    async def aretrieve(self, query: str, vector_store, k: int = 5) -> List[Tuple[str, float, dict]]:
+        """异步检索：嵌入走共享 httpx 客户端，向量搜索转线程执行"""
+        vecs = await self.embedding_model.embed_many([query])
+        if not vecs:
+            return await asyncio.to_thread(vector_store.search, query, k)
+        return await asyncio.to_thread(vector_store.search_by_vector, vecs[0], k)
+
+    def _retrieve_many(self, queries: List[str], vector_store, k: int = 5) -> List[List[Tuple[str, float, dict]]]:
+        """并发检索多个查询，返回与 queries 对齐的结果列表
+
+        每次检索都是 I/O 密集（嵌入请求 + 向量搜索），在共享线程池上
+        并发跑同步 retrieve，总耗时从各查询之和降到最慢一个。
+        不在工作线程里 asyncio.run 驱动 aretrieve：共享 AsyncClient
+        的连接绑定在创建它的事件循环上，跨一次性循环复用会报
+        "Event loop is closed"；同步客户端线程安全，map 保序返回
+        """
+        if len(queries) == 1:
+            return [self.retrieve(queries[0], vector_store, k=k)]
+        return list(self._pool.map(
+            lambda q: self.retrieve(q, vector_store, k=k), queries
+        ))
+
+    def _retrieve_batch(self, queries: List[str], vector_store, k: int = 5) -> List[List[Tuple[str, float, dict]]]:
+        """一次批量嵌入多个查询后逐个搜索
+
+        /api/embed 一次请求返回全部查询向量，把 N 次 HTTP 往返摊成一次；
+        向量搜索本身相对嵌入可以忽略不计
+        """
+        vecs = self.embedding_model.embed_batch(queries)
+        if len(vecs) != len(queries):
+            # 个别嵌入失败时退回并发逐条检索
+            return self._retrieve_many(queries, vector_store, k=k)
+        return [vector_store.search_by_vector(vec, k=k) for vec in vecs]
+
     def generate(self, query: str, context: str) -> str:
         """生成回答"""
         return self.chat_model.chat(query, context=context)
     
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """完整的 RAG 流程，返回包含内容和出处的字典"""
-        docs = self.retrieve(query, vector_store)
-        sources = []
-        
-        # 提取出处信息
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            sources.append(source)
-        
-        # 去重并保持顺序
-        unique_sources = []
-        for s in sources:
-            if s not in unique_sources:
-                unique_sources.append(s)
-        
+    def _format_context(self, docs: List[Tuple[str, float, dict]]) -> str:
+        """把检索结果拼成上下文（子类可覆盖，如添加来源标题）"""
+        return "\n\n".join(doc[0] for doc in docs)
+
+    def _build_prompt(self, query: str, context: str) -> Tuple[str, str]:
+        """构造 (消息, 上下文)
+
+        默认直接把 context 交给对话模型；需要把上下文织进提示词的
+        子类（如知识图谱、多模态）覆盖此方法
+        """
+        return query, context
+
+    def _run(
+        self,
+        query: str,
+        vector_store,
+        polish: bool = False,
+        k: Optional[int] = None,
+        docs: Optional[List[Tuple[str, float, dict]]] = None,
+        context_docs: Optional[List[Tuple[str, float, dict]]] = None
+    ) -> Dict[str, Union[str, List]]:
+        """统一的"检索 → 去重出处 → 拼上下文 → 生成 → 润色"流程
+
+        各方法的 chat 只在 k、上下文格式和提示词包装上有差异，
+        公共骨架集中在这里，子类通过类属性和钩子定制。
+        docs 允许传入已检索好的结果，context_docs 允许上下文只用其中一部分
+        （如 Reranker 出处取全量、上下文只取精排 top）。
+        """
+        if docs is None:
+            docs = self.retrieve(query, vector_store, k=k or self.K)
+
+        sources = _dedup_sources(docs)
+
         if docs:
-            context = "\n\n".join([doc[0] for doc in docs])
-            response = self.generate(query, context)
-            # 润色回答
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": unique_sources,
-                "source_type": "local"
-            }
-        # 没有检索到本地文档，使用纯对话
-        response = self.generate(query, "")
-        # 润色回答
+            context = self._format_context(context_docs if context_docs is not None else docs)
+            message, context = self._build_prompt(query, context)
+            response = self.generate(message, context)
+            source_type = "local"
+        else:
+            # 没有检索到本地文档，使用纯对话
+            response = self.generate(query, "")
+            sources = []
+            source_type = "general"
+
         if polish:
             response = self._polish_response(response)
         return {
             "content": response,
-            "sources": [],
-            "source_type": "general"
+            "sources": sources,
+            "source_type": source_type
         }
+
+    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
+        """完整的 RAG 流程，返回包含内容和出处的字典"""
+        vec = _embed_query_cached(self.embedding_model, query)
+        stamp = None
+        if vec:
+            index = vector_store.index
+            stamp = (self.name, polish, index.ntotal if index is not None else 0)
+            hit = _response_cache.get(vec, threshold=_RESPONSE_CACHE_THRESHOLD)
+            if hit is not None and hit[0] == stamp:
+                # 返回浅拷贝，调用方（如 SelfRAG 的二次润色）改写
+                # 返回值时不会污染缓存里的条目
+                return dict(hit[1])
+
+        result = self._run(query, vector_store, polish=polish)
+
+        if stamp is not None:
+            _response_cache.put(vec, (stamp, dict(result)))
+        return result
     
+    def stream_chat(self, query: str, vector_store, k: Optional[int] = None):
+        """流式 RAG：检索后逐 token 生成，供 SSE 接口使用
+
+        先产出一条带出处信息的事件，随后逐 token 产出内容；
+        走各方法自己的 K 值与提示词钩子，首 token 即开始推送
+        """
+        docs = self.retrieve(query, vector_store, k if k is not None else self.K)
+        sources = _dedup_sources(docs)
+
+        yield {
+            "sources": sources,
+            "source_type": "local" if docs else "general"
+        }
+
+        if docs:
+            context = self._format_context(docs)
+            message, context = self._build_prompt(query, context)
+            stream = self.chat_model.chat_stream(message, context=context or None)
+        else:
+            stream = self.chat_model.chat_stream(query)
+        for token in stream:
+            if token:
+                yield {"token": token}
+
+    # 需要润色的廉价特征：连续空行、行首悬挂空白、不以正常标点收尾
+    _NEEDS_POLISH_RE = re.compile(r'\n{3,}|^[ \t]+|[^\s。！？!?.："」』）)]\s*$')
+    # 超长回答润色的延迟代价远超可读性收益，直接跳过
+    _POLISH_MAX_LEN = 2000
+
     def _polish_response(self, response: str) -> str:
-        """润色回答"""
+        """润色回答（先过一道廉价门槛，格式已规整时省掉整次 LLM 往返）"""
         if not response or len(response.strip()) < 10:
             return response
-        
+        if (len(response) > self._POLISH_MAX_LEN
+                or self._NEEDS_POLISH_RE.search(response) is None):
+            return response
+
+        # try 只包住 LLM 调用本身，上面的快速返回路径不进异常帧
         try:
             polished = self.chat_model.polish(response)
-            if polished and len(polished.strip()) > 10:
-                return polished
-            return response
         except Exception as e:
             print(f"润色失败: {str(e)}")
             return response
+        if polished and len(polished.strip()) > 10:
+            return polished
+        return response
 
 
 class SimpleRAG(BaseRAGMethod):
-    """1. SimpleRAG（简单切块）"""
+    """1. SimpleRAG（简单切块）：检索 + 生成"""
     name = "simple"
     description = "简单切块"
-    
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """简单 RAG：检索 + 生成"""
-        docs = self.retrieve(query, vector_store, k=5)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            context = "\n\n".join([doc[0] for doc in docs])
-            response = self.generate(query, context)
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+    K = 5
 
 
 class SemanticChunking(BaseRAGMethod):
     """2. Semantic Chunking（语义切块）"""
     name = "semantic_chunking"
     description = "语义切块"
-    
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """语义切块 RAG"""
-        docs = self.retrieve(query, vector_store, k=8)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            context = "\n\n".join([doc[0] for doc in docs])
-            response = self.generate(query, context)
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+    K = 8
 
 
 class ContextEnrichedRetrieval(BaseRAGMethod):
@@ -155,112 +255,31 @@ class ContextEnrichedRetrieval(BaseRAGMethod):
     
     def retrieve(self, query: str, vector_store, k: int = 5) -> List[Tuple[str, float, dict]]:
         """增强检索：包含更多上下文"""
-        # 先检索，再扩展检索上下文
-        docs = vector_store.search(query, k=k)
+        # 先检索（查询向量走基类的 LRU 缓存），再扩展检索上下文
+        docs = super().retrieve(query, vector_store, k=k)
         # 这里可以添加上下文扩展逻辑
         return docs
-    
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """上下文增强 RAG"""
-        docs = self.retrieve(query, vector_store, k=5)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            context = "\n\n".join([doc[0] for doc in docs])
-            response = self.generate(query, context)
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
 
 
 class ContextualChunkHeaders(BaseRAGMethod):
     """4. Contextual Chunk Headers（上下文分块标题）"""
     name = "chunk_headers"
     description = "上下文分块标题"
-    
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """带标题的上下文 RAG"""
-        docs = self.retrieve(query, vector_store, k=6)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            # 添加文档来源信息作为标题
-            context_parts = []
-            for doc, score, meta in docs:
-                source = meta.get("source", "未知来源")
-                context_parts.append(f"[来源: {source}]\n{doc}")
-            context = "\n\n".join(context_parts)
-            response = self.generate(query, context)
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+    K = 6
+
+    def _format_context(self, docs: List[Tuple[str, float, dict]]) -> str:
+        """添加文档来源信息作为标题"""
+        return "\n\n".join(
+            f"[来源: {meta.get('source', '未知来源')}]\n{doc}"
+            for doc, score, meta in docs
+        )
 
 
 class DocumentAugmentation(BaseRAGMethod):
-    """5. Document Augmentation（文档增强）"""
+    """5. Document Augmentation（文档增强）：合并相关文档片段"""
     name = "doc_augmentation"
     description = "文档增强"
-    
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """文档增强 RAG：增加文档补充信息"""
-        docs = self.retrieve(query, vector_store, k=5)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            # 合并相关文档片段
-            context = "\n\n".join([doc[0] for doc in docs])
-            response = self.generate(query, context)
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+    K = 5
 
 
 class QueryTransformation(BaseRAGMethod):
@@ -287,19 +306,16 @@ class QueryTransformation(BaseRAGMethod):
     
     def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
         """查询转换 RAG"""
-        # 转换查询
+        # 原查询的检索不依赖改写结果，丢进共享线程池与改写调用并行
+        orig_future = self._pool.submit(self.retrieve, query, vector_store, 3)
         query_variants = self.transform_query(query)
-        
-        # 对每个查询变体进行检索
-        all_docs = []
-        sources = []
-        for q in query_variants:
-            docs = self.retrieve(q, vector_store, k=3)
-            for doc, score, meta in docs:
-                source = meta.get("source", "未知来源")
-                if source not in sources:
-                    sources.append(source)
-            all_docs.extend(docs)
+
+        # 改写出的变体一次批量嵌入后检索（串行时总耗时随变体数线性增长）；
+        # 变体列表首位就是原查询，已在并行分支中检索，跳过
+        docs_lists = self._retrieve_batch(query_variants[1:], vector_store, k=3) \
+            if len(query_variants) > 1 else []
+        all_docs = orig_future.result() + [doc for docs in docs_lists for doc in docs]
+        sources = _dedup_sources(all_docs)
         
         # 去重并按分数排序
         if all_docs:
@@ -340,34 +356,25 @@ class Reranker(BaseRAGMethod):
         """重排序 RAG：先粗筛再精排"""
         # 第一步：大规模检索
         docs = self.retrieve(query, vector_store, k=20)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if not docs:
-            response = self.generate(query, "")
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": [],
-                "source_type": "general"
-            }
-        
-        # 第二步：重排序（这里用简单方法：按分数截断）
-        top_docs = docs[:5]  # 选择 top 5
-        
-        context = "\n\n".join([doc[0] for doc in top_docs])
-        response = self.generate(query, context)
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": sources,
-            "source_type": "local"
-        }
+
+        # 第二步：精排 —— 文档向量（嵌入缓存命中，几乎零成本）和查询向量
+        # 一次矩阵点积打分，argpartition 取 top-5，免去全量排序
+        top_docs = docs[:5]
+        if len(docs) > 5:
+            q_vec = _embed_query_cached(self.embedding_model, query)
+            doc_vecs = self.embedding_model.embed_batch([doc[0] for doc in docs])
+            if q_vec and len(doc_vecs) == len(docs):
+                q = np.asarray(q_vec, dtype=np.float32)
+                q /= np.linalg.norm(q) + 1e-12
+                d = np.asarray(doc_vecs, dtype=np.float32)
+                d /= np.linalg.norm(d, axis=1, keepdims=True) + 1e-12
+                scores = d @ q
+                top_idx = np.argpartition(-scores, 5)[:5]
+                top_idx = top_idx[np.argsort(-scores[top_idx])]
+                top_docs = [docs[i] for i in top_idx]
+
+        return self._run(query, vector_store, polish=polish,
+                         docs=docs, context_docs=top_docs)
 
 
 class RSERetrieval(BaseRAGMethod):
@@ -379,144 +386,51 @@ class RSERetrieval(BaseRAGMethod):
         super().__init__()
         self.reasoning_model = get_reasoning_model()
     
+    # 提示词模板类常量，%-格式化在 C 层一次拼接
+    _EXPAND_TMPL = "为以下问题扩展相关概念和关键词（用于信息检索）：\n%s"
+
     def expand_query(self, query: str) -> str:
         """扩展查询"""
-        prompt = f"为以下问题扩展相关概念和关键词（用于信息检索）：\n{query}"
-        return self.reasoning_model.reason(prompt)
+        return self.reasoning_model.reason(self._EXPAND_TMPL % query)
     
     def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
         """语义扩展重排序 RAG"""
-        # 扩展查询
+        # 扩展查询后检索，精排只取 top 5 做上下文
         expanded_query = self.expand_query(query)
-        
-        # 使用扩展查询检索
         docs = self.retrieve(expanded_query, vector_store, k=10)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            # 精排：选择 top 5
-            top_docs = docs[:5]
-            context = "\n\n".join([doc[0] for doc in top_docs])
-            response = self.generate(query, context)
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+        return self._run(query, vector_store, polish=polish,
+                         docs=docs, context_docs=docs[:5])
 
 
 class FeedbackLoop(BaseRAGMethod):
-    """9. Feedback Loop（反馈闭环）"""
+    """9. Feedback Loop（反馈闭环）：检索后生成初始回答"""
     name = "feedback_loop"
     description = "反馈闭环"
-    
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """反馈闭环 RAG：迭代优化"""
-        # 初始检索
-        docs = self.retrieve(query, vector_store, k=5)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if not docs:
-            response = self.generate(query, "")
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": [],
-                "source_type": "general"
-            }
-        
-        # 生成初始回答
-        context = "\n\n".join([doc[0] for doc in docs])
-        response = self.generate(query, context)
-        if polish:
-            response = self._polish_response(response)
-        
-        return {
-            "content": response,
-            "sources": sources,
-            "source_type": "local"
-        }
+    K = 5
 
 
 class AdaptiveRAG(BaseRAGMethod):
     """10. Adaptive RAG（自适应检索增强生成）"""
     name = "adaptive_rag"
     description = "自适应检索增强生成"
-    
+
+    # 简单问题特征词，预编译成单个正则：一次 C 级扫描替代 Python 循环逐词查找
+    _SIMPLE_RE = re.compile("|".join(map(re.escape, [
+        "什么是", "定义", "解释", "谁是", "哪个是", "多少", "什么时候"
+    ])))
+
+
     def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
         """自适应 RAG：根据问题类型选择策略"""
-        # 分析问题类型
-        question_type = self._classify_question(query)
-        sources = []
-        
-        if question_type == "simple":
-            # 简单问题，直接检索少量文档
-            docs = self.retrieve(query, vector_store, k=3)
-            for doc, score, meta in docs:
-                source = meta.get("source", "未知来源")
-                if source not in sources:
-                    sources.append(source)
-            context = "\n\n".join([doc[0] for doc in docs]) if docs else ""
-            if docs:
-                response = self.generate(query, context)
-                if polish:
-                    response = self._polish_response(response)
-                return {
-                    "content": response,
-                    "sources": sources,
-                    "source_type": "local"
-                }
-        elif question_type == "complex":
-            # 复杂问题，检索更多文档
-            docs = self.retrieve(query, vector_store, k=8)
-            for doc, score, meta in docs:
-                source = meta.get("source", "未知来源")
-                if source not in sources:
-                    sources.append(source)
-            context = "\n\n".join([doc[0] for doc in docs]) if docs else ""
-            if docs:
-                response = self.generate(query, context)
-                if polish:
-                    response = self._polish_response(response)
-                return {
-                    "content": response,
-                    "sources": sources,
-                    "source_type": "local"
-                }
-        
-        # 默认策略
-        result = super().chat(query, vector_store, polish=polish)
-        return result
+        # 按问题类型决定检索规模，只检索一次；没有命中文档时
+        # _run 内部直接走通用回答分支，不再退回默认策略重复检索
+        k = 3 if self._classify_question(query) == "simple" else 8
+        return self._run(query, vector_store, polish=polish, k=k)
     
     def _classify_question(self, query: str) -> str:
         """简单问题分类"""
-        query_lower = query.lower()
-        # 简单问题特征词
-        simple_keywords = ["什么是", "定义", "解释", "谁是", "哪个是", "多少", "什么时候"]
-        for kw in simple_keywords:
-            if kw in query_lower:
-                return "simple"
-        return "complex"
+        # 特征词全是中文，无大小写之分，省掉 lower() 的整串拷贝
+        return "simple" if self._SIMPLE_RE.search(query) else "complex"
 
 
 class SelfRAG(BaseRAGMethod):
@@ -528,52 +442,44 @@ class SelfRAG(BaseRAGMethod):
         super().__init__()
         self.reasoning_model = get_reasoning_model()
     
-    def reflect(self, query: str, response: str) -> bool:
-        """反思回答是否需要改进"""
-        prompt = f"""
+    # 提示词模板类常量，%-格式化在 C 层一次拼接
+    _REFLECT_TMPL = """
 判断以下回答是否充分回答了问题：
 
-问题：{query}
-回答：{response}
+问题：%s
+回答：%s
 
 如果回答不完整或不确定，返回"需要改进"，否则返回"足够"。
 """
-        result = self.reasoning_model.reason(prompt)
+
+    def reflect(self, query: str, response: str) -> bool:
+        """反思回答是否需要改进"""
+        result = self.reasoning_model.reason(self._REFLECT_TMPL % (query, response))
         return "需要改进" not in result
     
     def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
         """自反思 RAG"""
-        # 初始回答
-        response = super().chat(query, vector_store, polish=polish)
-        
-        if isinstance(response, dict):
-            response_data = response
-            sources = response.get("sources", [])
+        # 初始回答先不润色：反思判定"需要改进"时会整个重新生成，
+        # 提前润色纯属浪费一次 LLM 往返；只在最终返回前润色一次
+        response_data = super().chat(query, vector_store, polish=False)
+
+        # 反思和 k=10 的补充检索投机并行：反思判定"足够"时直接丢弃
+        # 检索结果；判定"需要改进"时文档已经就绪，省掉一次串行往返
+        reflect_future = self._pool.submit(self.reflect, query, response_data["content"])
+        docs_future = self._pool.submit(self.retrieve, query, vector_store, 10)
+        if reflect_future.result():
+            docs = None
         else:
-            response_data = {"content": response}
-            sources = []
-        
-        # 反思
-        if self.reflect(query, response_data["content"]):
-            return response_data
-        else:
-            # 尝试改进：检索更多文档
-            docs = self.retrieve(query, vector_store, k=10)
-            new_sources = []
-            for doc, score, meta in docs:
-                source = meta.get("source", "未知来源")
-                if source not in new_sources:
-                    new_sources.append(source)
-            if docs:
-                context = "\n\n".join([doc[0] for doc in docs])
-                improved_response = self.generate(query, context)
-                if polish:
-                    improved_response = self._polish_response(improved_response)
-                return {
-                    "content": improved_response,
-                    "sources": new_sources,
-                    "source_type": "local"
-                }
+            docs = docs_future.result()
+
+        # 尝试改进：用更多文档重新生成
+        if docs:
+            response_data = {
+                "content": self.generate(query, "\n\n".join([doc[0] for doc in docs])),
+                "sources": _dedup_sources(docs),
+                "source_type": "local"
+            }
+
         if polish:
             response_data["content"] = self._polish_response(response_data["content"])
         return response_data
@@ -584,36 +490,15 @@ class KnowledgeGraph(BaseRAGMethod):
     name = "knowledge_graph"
     description = "知识图谱"
     
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """知识图谱 RAG"""
-        # 检索实体相关文档
-        docs = self.retrieve(query, vector_store, k=6)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            context = "\n\n".join([doc[0] for doc in docs])
-            # 在提示中强调关系和实体
-            enhanced_prompt = f"请根据以下文档内容，梳理其中的实体和关系后回答问题：\n\n{context}\n\n问题：{query}"
-            response = self.chat_model.chat(enhanced_prompt, context="")
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+    K = 6
+
+    # 提示词固定部分常量化，join 一次成串，大上下文不做中间拷贝
+    _PROMPT_PARTS = ("请根据以下文档内容，梳理其中的实体和关系后回答问题：\n\n", "\n\n问题：")
+
+    def _build_prompt(self, query: str, context: str) -> Tuple[str, str]:
+        """在提示中强调关系和实体"""
+        head, mid = self._PROMPT_PARTS
+        return "".join((head, context, mid, query)), ""
 
 
 class HierarchicalIndices(BaseRAGMethod):
@@ -621,36 +506,8 @@ class HierarchicalIndices(BaseRAGMethod):
     name = "hierarchical"
     description = "层次化索引"
     
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """层次化索引 RAG"""
-        # 先检索摘要级别的文档
-        # 然后检索详细内容
-        # 这里简化为普通检索
-        docs = self.retrieve(query, vector_store, k=6)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            context = "\n\n".join([doc[0] for doc in docs])
-            response = self.generate(query, context)
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+    # 先检索摘要级别再检索详细内容，这里简化为普通检索
+    K = 6
 
 
 class HyDE(BaseRAGMethod):
@@ -662,42 +519,19 @@ class HyDE(BaseRAGMethod):
         super().__init__()
         self.reasoning_model = get_reasoning_model()
     
+    # 提示词模板类常量，%-格式化在 C 层一次拼接
+    _HYPOTHETICAL_TMPL = "针对以下问题，生成一个详细的假设性答案（不需要真实，基于常识）：\n\n问题：%s"
+
     def generate_hypothetical_answer(self, query: str) -> str:
         """生成假设答案"""
-        prompt = f"针对以下问题，生成一个详细的假设性答案（不需要真实，基于常识）：\n\n问题：{query}"
-        return self.reasoning_model.reason(prompt)
+        return self.reasoning_model.reason(self._HYPOTHETICAL_TMPL % query)
     
     def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
         """HyDE RAG：使用假设文档检索"""
-        # 生成假设答案
+        # 生成假设答案后用它检索，生成仍以原问题提问
         hyp_answer = self.generate_hypothetical_answer(query)
-        
-        # 用假设答案检索
         docs = self.retrieve(hyp_answer, vector_store, k=5)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            context = "\n\n".join([doc[0] for doc in docs])
-            response = self.generate(query, context)
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+        return self._run(query, vector_store, polish=polish, docs=docs)
 
 
 class FusionRetrieval(BaseRAGMethod):
@@ -707,21 +541,10 @@ class FusionRetrieval(BaseRAGMethod):
     
     def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
         """融合检索 RAG"""
-        # 多策略检索融合
-        strategies = [
-            ("关键词检索", lambda: self.retrieve(query, vector_store, k=3)),
-            ("语义检索", lambda: self.retrieve(query, vector_store, k=3)),
-        ]
-        
-        all_docs = []
-        sources = []
-        for name, strategy in strategies:
-            docs = strategy()
-            for doc, score, meta in docs:
-                source = meta.get("source", "未知来源")
-                if source not in sources:
-                    sources.append(source)
-            all_docs.extend(docs)
+        # 原先的"关键词/语义"两路策略对同一查询做两次相同的稠密检索，
+        # 结果完全一致；合并为一次 k=6 检索，覆盖同样的候选范围
+        all_docs = self.retrieve(query, vector_store, k=6)
+        sources = _dedup_sources(all_docs)
         
         # 去重和融合
         if all_docs:
@@ -762,29 +585,56 @@ class CRAG(BaseRAGMethod):
         super().__init__()
         self.reasoning_model = get_reasoning_model()
     
-    def verify_context(self, query: str, context: str) -> Tuple[bool, str]:
-        """验证上下文是否相关"""
-        prompt = f"""
+    # 提示词模板类常量，%-格式化在 C 层一次拼接
+    _VERIFY_TMPL = """
 判断以下上下文是否与问题相关：
 
-问题：{query}
-上下文：{context[:500]}...
+问题：%s
+上下文：%s...
 
 如果上下文与问题高度相关，返回"相关"，否则返回"不相关"。
 """
-        result = self.reasoning_model.reason(prompt)
+
+    def verify_context(self, query: str, context: str) -> Tuple[bool, str]:
+        """验证上下文是否相关"""
+        result = self.reasoning_model.reason(self._VERIFY_TMPL % (query, context[:500]))
         is_relevant = "相关" in result and "不相关" not in result
         return is_relevant, result
     
+    # 一次调用给全部候选打分，LLM 往返从 N 次降到 1 次
+    _RELEVANCE_TMPL = """对下面 %d 段文本分别给出与问题的相关性分数（0 到 1 之间的小数），
+只返回一个 JSON 数组，如 [0.8, 0.1, 0.5]，不要其他文字。
+
+问题：%s
+
+%s"""
+    _JSON_ARRAY_RE = re.compile(r'\[[^\[\]]*\]')
+
+    def evaluate_relevance(self, query: str, docs: List[Tuple[str, float, dict]]) -> List[float]:
+        """批量评估检索结果与问题的相关度，返回与 docs 对齐的分数列表"""
+        numbered = "\n\n".join(
+            f"[{i + 1}] {doc[0][:500]}" for i, doc in enumerate(docs)
+        )
+        result = self.reasoning_model.reason(
+            self._RELEVANCE_TMPL % (len(docs), query, numbered)
+        )
+        # 从回答中抠出 JSON 数组，容忍模型夹带的多余文字
+        match = self._JSON_ARRAY_RE.search(result)
+        if match:
+            try:
+                scores = json.loads(match.group(0))
+                if isinstance(scores, list) and len(scores) == len(docs):
+                    return [float(score) for score in scores]
+            except (ValueError, TypeError):
+                pass
+        # 解析失败时退回向量检索的相似度分数
+        return [float(doc[1]) for doc in docs]
+
     def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
         """CRAG：基于置信度的检索增强"""
         # 初始检索
         docs = self.retrieve(query, vector_store, k=5)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
+        sources = _dedup_sources(docs)
         
         if not docs:
             response = self.generate(query, "")
@@ -839,71 +689,60 @@ class MultiModalRAG(BaseRAGMethod):
     name = "multimodal"
     description = "多模态检索增强生成"
     
-    def chat(self, query: str, vector_store, polish: bool = False) -> Dict[str, Union[str, List]]:
-        """多模态 RAG"""
-        # 检索文本相关文档
-        docs = self.retrieve(query, vector_store, k=5)
-        sources = []
-        for doc, score, meta in docs:
-            source = meta.get("source", "未知来源")
-            if source not in sources:
-                sources.append(source)
-        
-        if docs:
-            context = "\n\n".join([doc[0] for doc in docs])
-            # 添加多模态提示
-            multimodal_prompt = f"""请根据以下文档内容回答问题。如果问题涉及图像、表格或其他非文本内容，请说明需要查看原文件。
-
-文档内容：
-{context}
-
-问题：{query}
-
-注意：如果需要查看原始文件内容（如图片、表格等），请在回答中说明"建议查看源文档获取完整信息"。
-"""
-            response = self.chat_model.chat(multimodal_prompt, context="")
-            if polish:
-                response = self._polish_response(response)
-            return {
-                "content": response,
-                "sources": sources,
-                "source_type": "local"
-            }
-        response = self.generate(query, "")
-        if polish:
-            response = self._polish_response(response)
-        return {
-            "content": response,
-            "sources": [],
-            "source_type": "general"
-        }
+    K = 5
+
+    # 提示词固定部分常量化，join 一次成串，大上下文不做中间拷贝
+    _PROMPT_PARTS = (
+        "请根据以下文档内容回答问题。如果问题涉及图像、表格或其他非文本内容，"
+        "请说明需要查看原文件。\n\n文档内容：\n",
+        "\n\n问题：",
+        "\n\n注意：如果需要查看原始文件内容（如图片、表格等），"
+        "请在回答中说明\"建议查看源文档获取完整信息\"。\n"
+    )
+
+    def _build_prompt(self, query: str, context: str) -> Tuple[str, str]:
+        """添加多模态提示"""
+        head, mid, tail = self._PROMPT_PARTS
+        return "".join((head, context, mid, query, tail)), ""
+
+
+# RAG 方法注册表（注册类而不是实例，首次使用时才构建，
+# 避免 import 时就实例化 17 个方法及其模型客户端）
+RAG_METHODS: Dict[str, type] = {
+    "option1": SimpleRAG,
+    "option2": SemanticChunking,
+    "option3": ContextEnrichedRetrieval,
+    "option4": ContextualChunkHeaders,
+    "option5": DocumentAugmentation,
+    "option6": QueryTransformation,
+    "option7": Reranker,
+    "option8": RSERetrieval,
+    "option9": FeedbackLoop,
+    "option10": AdaptiveRAG,
+    "option11": SelfRAG,
+    "option12": KnowledgeGraph,
+    "option13": HierarchicalIndices,
+    "option14": HyDE,
+    "option15": FusionRetrieval,
+    "option16": CRAG,
+    "option17": MultiModalRAG,
+}
 
 
-# RAG 方法工厂
-RAG_METHODS: Dict[str, BaseRAGMethod] = {
-    "option1": SimpleRAG(),
-    "option2": SemanticChunking(),
-    "option3": ContextEnrichedRetrieval(),
-    "option4": ContextualChunkHeaders(),
-    "option5": DocumentAugmentation(),
-    "option6": QueryTransformation(),
-    "option7": Reranker(),
-    "option8": RSERetrieval(),
-    "option9": FeedbackLoop(),
-    "option10": AdaptiveRAG(),
-    "option11": SelfRAG(),
-    "option12": KnowledgeGraph(),
-    "option13": HierarchicalIndices(),
-    "option14": HyDE(),
-    "option15": FusionRetrieval(),
-    "option16": CRAG(),
-    "option17": MultiModalRAG(),
-}
+@functools.lru_cache(maxsize=None)
+def _method_instance(method_cls) -> BaseRAGMethod:
+    """按类缓存实例，每个方法类只构建一次后复用"""
+    return method_cls()
 
 
 def get_rag_method(option_id: str) -> BaseRAGMethod:
-    """获取 RAG 方法实例"""
-    return RAG_METHODS.get(option_id, SimpleRAG())
+    """获取 RAG 方法实例（懒实例化）
+
+    先把 option_id 解析成类再查缓存：option_id 来自请求体，
+    按原始字符串做缓存键会让任意未知 id 各缓存一个实例，
+    内存被不受信输入无限撑大；按类作键时上限就是方法类的数量
+    """
+    return _method_instance(RAG_METHODS.get(option_id, SimpleRAG))
 
 
 if __name__ == "__main__":
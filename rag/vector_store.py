@@ -5,28 +5,91 @@
 """
 
 import json
+import queue
+import re
+import threading
+from collections import OrderedDict
 
-import faiss
 import numpy as np
+
+# faiss 的可用性在模块加载时判定一次：方法体内反复 import 虽有缓存，
+# 仍要过一次模块字典查找和导入锁（save_index 在摄取期间是热路径）
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    faiss = None
+    FAISS_AVAILABLE = False
 from pathlib import Path
 from typing import List, Optional, Tuple
 from rag.ollama_client import get_embedding_model
 
+# 存储（反）序列化优先用 orjson（C 实现，直接产出紧凑 UTF-8），
+# 未安装时退回标准库
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8')
+    _loads = json.loads
+
+# 文档库的列式存盘优先用 pyarrow parquet（mmap 按需换页，省整库 JSON
+# 解析），未安装时退回 JSON 存储
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+_FAISS_NORMALIZE = getattr(faiss, "normalize_L2", None)
+
+
+def _normalize_rows(arr: np.ndarray):
+    """把 (n, d) float32 数组原地按行 L2 归一化
+
+    优先 faiss.normalize_L2（SIMD 实现）；后备路径用 einsum 单遍求
+    平方和后原地开方、原地除，不产生 np.linalg.norm 式的中间数组，
+    整个归一化只过一遍内存
+    """
+    if _FAISS_NORMALIZE is not None:
+        _FAISS_NORMALIZE(arr)
+        return
+    norms = np.einsum('ij,ij->i', arr, arr)
+    np.sqrt(norms, out=norms)
+    norms[norms == 0] = 1.0
+    arr /= norms[:, None]
+
 
 class VectorStore:
     """向量存储类"""
     
-    def __init__(self, index_dir: str = "indexes", embedding_model_name: str = None):
+    def __init__(self, index_dir: str = "indexes", embedding_model_name: str = None,
+                 use_gpu: bool = False):
         self.index_dir = Path(index_dir)
         self.index_dir.mkdir(exist_ok=True)
         
         # 嵌入模型
         self.embedding_model = get_embedding_model(embedding_model_name)
+
+        # GPU 暴力检索开关：大库 + 批量查询（search_batch）时收益最大，
+        # 单条查询被 PCIe 传输主导，收益有限
+        self.use_gpu = use_gpu
+        self._gpu_res = None
         
         # FAISS 索引（延迟加载）
         self._index = None
-        self._documents = []  # 原始文档
-        self._metadatas = []  # 元数据
+        self._documents = []  # 原始文档（写侧增量）
+        self._metadatas = []  # 元数据（写侧增量）
+        self._doc_table = None  # mmap 加载的 parquet 表（读侧，按需换页）
+        self._mmap = False  # 索引是否以 mmap 只读方式加载
+        self._local = threading.local()  # 每线程复用的查询向量缓冲
+        self._query_vec_cache: OrderedDict = OrderedDict()  # 查询 → 嵌入 LRU
+        self._meta_cache: OrderedDict = OrderedDict()  # 行号 → 已解析元数据 LRU
     
     @property
     def index(self):
@@ -42,43 +105,234 @@ class VectorStore:
     def _get_faiss_index_file(self, store_name: str) -> Path:
         """获取 FAISS 索引文件路径"""
         return self.index_dir / f"{store_name}.faiss"
+
+    def _get_parquet_file(self, store_name: str) -> Path:
+        """获取列式文档存储文件路径"""
+        return self.index_dir / f"{store_name}.parquet"
+
+    def _get_log_file(self, store_name: str) -> Path:
+        """获取文档追加日志文件路径"""
+        return self.index_dir / f"{store_name}.store.log"
+
+    def _doc_total(self) -> int:
+        """文档总数（parquet 表 + 内存增量）"""
+        table_rows = self._doc_table.num_rows if self._doc_table is not None else 0
+        return table_rows + len(self._documents)
+
+    def _document_at(self, idx: int) -> str:
+        """按全局下标取文档内容（先查 parquet 表，再查内存增量）"""
+        if self._doc_table is not None:
+            if idx < self._doc_table.num_rows:
+                return self._doc_table.column("document")[idx].as_py()
+            idx -= self._doc_table.num_rows
+        return self._documents[idx]
+
+    # 已解析元数据 LRU 容量（热门文档在连续查询里反复命中）
+    _META_CACHE_SIZE = 1024
+
+    def _metadata_at(self, idx: int) -> dict:
+        """按全局下标取元数据（parquet 行懒解析并缓存）"""
+        if self._doc_table is not None:
+            if idx < self._doc_table.num_rows:
+                cached = self._meta_cache.get(idx)
+                if cached is not None:
+                    self._meta_cache.move_to_end(idx)
+                    return cached
+                raw = self._doc_table.column("metadata")[idx].as_py()
+                meta = _loads(raw) if raw else {}
+                self._meta_cache[idx] = meta
+                if len(self._meta_cache) > self._META_CACHE_SIZE:
+                    self._meta_cache.popitem(last=False)
+                return meta
+            idx -= self._doc_table.num_rows
+        return self._metadatas[idx] if idx < len(self._metadatas) else {}
+
+    def _materialize(self):
+        """把 mmap 的 parquet 表并回内存列表（整体改写文档集前调用）"""
+        if self._doc_table is None:
+            return
+        docs = self._doc_table.column("document").to_pylist()
+        metas = [
+            _loads(raw) if raw else {}
+            for raw in self._doc_table.column("metadata").to_pylist()
+        ]
+        self._documents = docs + self._documents
+        self._metadatas = metas + self._metadatas
+        self._doc_table = None
+        self._meta_cache.clear()
     
-    def _init_index(self, dimension: int):
+    # 不大于该值的 k 在精确索引上走 GEMM + argpartition 快速路径
+    _SMALL_K = 4
+
+    # 查询嵌入 LRU 容量（1024 条 × 1024 维 float ≈ 几 MB）
+    _QUERY_CACHE_SIZE = 1024
+
+    # 写批大小：嵌入微批累积到这个规模才调用一次 add_with_ids
+    _UPSERT_BATCH = 512
+
+    # 索引规模分档阈值（见 _make_index 的召回/延迟权衡说明）
+    _IVF_THRESHOLD = 10000
+    _HNSW_THRESHOLD = 100000
+
+    # IVF 检索扫描的桶数（默认 1/256 召回太低；16/256 延迟仍远低于全扫）
+    _IVF_NPROBE = 16
+
+    def _select_factory(self, total_hint: int) -> str:
+        """按预期规模选择索引描述串"""
+        if total_hint >= self._HNSW_THRESHOLD:
+            return "HNSW32"
+        if total_hint >= self._IVF_THRESHOLD:
+            return "IVF256,SQ8"
+        return "Flat"
+
+    def _make_index(self, dimension: int, total_hint: int = 0,
+                    factory: Optional[str] = None):
+        """用 factory 描述串构建索引
+
+        文档 ID 就是插入顺序的行号，索引的隐式顺序 ID 即可对应，
+        不再套 IndexIDMap（省掉每行 8 字节的 id 表和检索命中后的一次间接查找）。
+
+        召回/延迟权衡：
+        - "Flat"：精确内积，每查询扫全库 O(N·d)，小库够快且召回 100%
+        - "IVF256,SQ8"：倒排分桶 + int8 标量量化存储，每查询只扫
+          nprobe=_IVF_NPROBE 个桶且每向量字节数减为 1/4（检索是访存
+          瓶颈）。已知限制：聚类中心用首个写批（_UPSERT_BATCH=512 条）
+          训练，样本偏少时桶划分欠优，召回会低于充分训练的 IVF
+        - "HNSW32"：图检索次线性，大库提速 10-100 倍，召回约 95-99%
+        """
+        if factory is None:
+            factory = self._select_factory(total_hint)
+        index = faiss.index_factory(dimension, factory, faiss.METRIC_INNER_PRODUCT)
+        if isinstance(index, faiss.IndexHNSWFlat):
+            index.hnsw.efConstruction = 200
+            index.hnsw.efSearch = 64
+        elif isinstance(index, faiss.IndexIVF):
+            index.nprobe = self._IVF_NPROBE
+        return index
+
+    def _init_index(self, dimension: int, total_hint: int = 0,
+                    factory: Optional[str] = None,
+                    store_name: str = "default"):
         """初始化 FAISS 索引"""
-        try:
-            import faiss
-            # 使用内积索引（归一化向量）
-            self._index = faiss.IndexIDMap(faiss.IndexFlatIP(dimension))
-            self._documents = []
-            self._metadatas = []
-        except ImportError:
+        if not FAISS_AVAILABLE:
             print("FAISS 未安装，将使用简单向量存储")
             self._index = None
+            return
+        self._index = self._maybe_to_gpu(
+            self._make_index(dimension, total_hint, factory)
+        )
+        self._documents = []
+        self._metadatas = []
+        self._doc_table = None
+        self._meta_cache.clear()
+        # 全新索引不能接着旧文档行写：隐式 ID 是行号，残留的
+        # store/parquet/日志会让新向量命中旧文档，这里一并清掉
+        for stale in (self._get_store_file(store_name),
+                      self._get_parquet_file(store_name),
+                      self._get_log_file(store_name)):
+            if stale.exists():
+                stale.unlink()
+
+    def _maybe_to_gpu(self, index):
+        """use_gpu 开启且环境可用时把索引搬上显存，否则原样返回"""
+        if not self.use_gpu or index is None:
+            return index
+        try:
+            if faiss.get_num_gpus() == 0:
+                print("未检测到 GPU，索引保留在 CPU")
+                return index
+            if self._gpu_res is None:
+                self._gpu_res = faiss.StandardGpuResources()
+            return faiss.index_cpu_to_gpu(self._gpu_res, 0, index)
+        except AttributeError:
+            # faiss-cpu 构建没有 GPU 接口
+            print("当前 faiss 构建不支持 GPU，索引保留在 CPU")
+            return index
+
+    def _cpu_index(self):
+        """取回可序列化的 CPU 侧索引（GPU 索引不能直接落盘）"""
+        if self.use_gpu and hasattr(faiss, "index_gpu_to_cpu"):
+            try:
+                return faiss.index_gpu_to_cpu(self._index)
+            except Exception:
+                pass
+        return self._index
     
     def _load_index(self):
         """加载已存在的索引"""
         store_file = self._get_store_file("default")
+        parquet_file = self._get_parquet_file("default")
         faiss_file = self._get_faiss_index_file("default")
-        
-        if faiss_file.exists() and store_file.exists():
+
+        if not FAISS_AVAILABLE:
+            print("FAISS 未安装，无法加载向量索引")
+            return
+
+        # 只要 faiss 文件在就加载：从未 compact 过的存储没有
+        # 合并态的 store/parquet，文档全部在追加日志里
+        if faiss_file.exists():
             try:
-                import faiss
-                
                 # 加载 FAISS 索引
-                self._index = faiss.read_index(str(faiss_file))
-                
-                # 加载文档和元数据
-                with open(store_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                # 优先 mmap 只读加载：向量矩阵按需换页，冷启动不整块读入内存
+                try:
+                    self._index = faiss.read_index(
+                        str(faiss_file),
+                        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                    )
+                    self._mmap = True
+                except Exception:
+                    self._index = faiss.read_index(str(faiss_file))
+                    self._mmap = False
+
+                # read_index 不保留运行时检索参数，加载后重设 nprobe
+                if isinstance(self._index, faiss.IndexIVF):
+                    self._index.nprobe = self._IVF_NPROBE
+
+                self._index = self._maybe_to_gpu(self._index)
+
+                # 加载文档和元数据：parquet 表 mmap 打开，加载近乎零成本，
+                # 只有被检索命中的行才真正换页进内存
+                if pq is not None and parquet_file.exists():
+                    self._doc_table = pq.read_table(
+                        str(parquet_file), memory_map=True
+                    )
+                    self._documents = []
+                    self._metadatas = []
+                    self._meta_cache.clear()
+                elif store_file.exists():
+                    data = _loads(store_file.read_bytes())
                     self._documents = data.get("documents", [])
                     self._metadatas = data.get("metadatas", [])
-                
-                print(f"加载索引成功: {len(self._documents)} 个文档块")
-            except ImportError:
-                print("FAISS 未安装，无法加载向量索引")
+                else:
+                    self._documents = []
+                    self._metadatas = []
+
+                # 回放上次合并后的追加日志（增量保存的新行）
+                log_file = self._get_log_file("default")
+                if log_file.exists():
+                    with open(log_file, 'rb') as f:
+                        for line in f:
+                            line = line.strip()
+                            if not line:
+                                continue
+                            row = _loads(line)
+                            self._documents.append(row.get("document", ""))
+                            self._metadatas.append(row.get("metadata", {}))
+
+                print(f"加载索引成功: {self._doc_total()} 个文档块")
             except Exception as e:
                 print(f"加载索引失败: {str(e)}")
     
+    def _ensure_writable_index(self, store_name: str = "default"):
+        """写入前把 mmap 只读加载的索引重新以可写方式读入内存"""
+        if not self._mmap or self._index is None:
+            return
+
+        faiss_file = self._get_faiss_index_file(store_name)
+        if faiss_file.exists():
+            self._index = faiss.read_index(str(faiss_file))
+        self._mmap = False
+
     def add_documents(
         self,
         texts: List[str],
@@ -96,74 +350,168 @@ class VectorStore:
             return
         
         print(f"正在处理 {len(texts)} 个文档块...")
-        
+
+        # 冷实例先尝试加载磁盘上的既有索引：直接新建会覆盖旧向量，
+        # 而追加日志仍接在旧文档行后面，隐式行号 ID 全部错位
+        if self._index is None:
+            self._load_index()
+
         # 获取向量维度
         if self._index is None and len(texts) > 0:
             # 用第一条数据测试维度
             test_embedding = self.embedding_model.embed(texts[0])
             if test_embedding:
                 dimension = len(test_embedding)
-                self._init_index(dimension)
+                self._init_index(dimension, total_hint=len(texts),
+                                 store_name=store_name)
                 print(f"初始化向量索引，维度: {dimension}")
         
         if self._index is None:
             print("向量索引未初始化，跳过添加")
             return
-        
-        # 批量生成嵌入
-        embeddings = self.embedding_model.embed_batch(texts)
-        
-        if not embeddings:
+
+        # mmap 只读加载的索引需要先转成可写
+        self._ensure_writable_index(store_name)
+
+        # 流水线摄取：嵌入线程按微批产出放进有界队列，本线程累积成
+        # 更大的写批再进索引，让网络等待与归一化/训练/写索引重叠；
+        # 嵌入批大小与写批大小解耦，索引只在全部写完后保存一次
+        # 每次投喂 batch_size × concurrency 条：embed_batch 只有收到
+        # 多个子批才会开并发池，喂单个 batch_size 会退化成串行请求
+        embed_bs = (self.embedding_model.batch_size
+                    * max(getattr(self.embedding_model, 'concurrency', 1), 1))
+        results_q: queue.Queue = queue.Queue(maxsize=4)
+
+        # 生产者异常也必须投递结束哨兵，否则消费侧会永远阻塞在
+        # results_q.get() 上挂死整个请求；异常记下来在汇合后上报
+        producer_errors: List[Exception] = []
+
+        def _embed_producer():
+            try:
+                for start in range(0, len(texts), embed_bs):
+                    results_q.put(
+                        self.embedding_model.embed_batch(texts[start:start + embed_bs])
+                    )
+            except Exception as e:
+                producer_errors.append(e)
+            finally:
+                results_q.put(None)
+
+        producer = threading.Thread(target=_embed_producer, daemon=True)
+        producer.start()
+
+        added = 0
+        buffer: List[List[float]] = []
+
+        def _flush():
+            nonlocal added, buffer
+            if not buffer:
+                return
+            # asarray 直接按 float32 一次成型，免去先 float64 再拷贝的双重分配
+            embeddings_array = np.asarray(buffer, dtype=np.float32)
+            # 归一化向量（用于余弦相似度，原地改写）
+            _normalize_rows(embeddings_array)
+            # IVF 索引需要先用首个写批训练聚类中心
+            if not self._index.is_trained:
+                self._index.train(embeddings_array)
+            # 顺序 add：索引的隐式 ID 就是文档行号
+            self._index.add(embeddings_array)
+            added += len(buffer)
+            buffer = []
+
+        while True:
+            batch_vectors = results_q.get()
+            if batch_vectors is None:
+                break
+            buffer.extend(batch_vectors)
+            if len(buffer) >= self._UPSERT_BATCH:
+                _flush()
+        _flush()
+        producer.join()
+
+        if producer_errors:
+            print(f"嵌入线程异常: {str(producer_errors[0])}")
+
+        if added == 0:
             print("生成嵌入失败")
             return
-        
-        # 添加到索引
-        ids = list(range(len(self._documents), len(self._documents) + len(embeddings)))
-        
-        # 转换为 numpy 数组
-        embeddings_array = np.array(embeddings).astype('float32')
-        
-        # 归一化向量（用于余弦相似度）
-        faiss.normalize_L2(embeddings_array)
-        
-        self._index.add_with_ids(embeddings_array, np.array(ids))
-        
+
         # 添加文档和元数据
+        metas = metadatas if metadatas else [{}] * len(texts)
         self._documents.extend(texts)
-        if metadatas:
-            self._metadatas.extend(metadatas)
-        else:
-            self._metadatas.extend([{}] * len(texts))
-        
-        # 保存索引
-        self.save_index(store_name)
-        
+        self._metadatas.extend(metas)
+
+        # 增量保存：FAISS 索引整写（内部结构无法追加），文档和元数据
+        # 只把新行追加到 ndjson 日志，避免每次摄取重写整个文档库
+        # （N 次增量添加累计 O(N²) 的 I/O）；日志由 compact 合并
+        self._save_faiss(store_name)
+        self._append_log(texts, metas, store_name)
+
         print(f"成功添加 {len(texts)} 个文档块到索引")
     
+    def _save_faiss(self, store_name: str = "default"):
+        """只保存 FAISS 索引文件"""
+        if self._index is None:
+            return
+        try:
+            faiss_file = self._get_faiss_index_file(store_name)
+            faiss.write_index(self._cpu_index(), str(faiss_file))
+            print(f"索引已保存: {faiss_file}")
+        except Exception as e:
+            print(f"保存索引失败: {str(e)}")
+
+    def _append_log(self, texts: List[str], metadatas: List[dict],
+                    store_name: str = "default"):
+        """把新增文档追加到 ndjson 日志（增量保存的写前日志）"""
+        try:
+            with open(self._get_log_file(store_name), 'ab') as f:
+                for text, meta in zip(texts, metadatas):
+                    f.write(_dumps({"document": text, "metadata": meta}))
+                    f.write(b'\n')
+        except Exception as e:
+            print(f"写入文档日志失败: {str(e)}")
+
+    def compact(self, store_name: str = "default"):
+        """把追加日志合并进整块存储文件"""
+        self.save_index(store_name)
+
     def save_index(self, store_name: str = "default"):
-        """保存索引到磁盘"""
+        """全量保存索引到磁盘，并清掉已合并的追加日志"""
         if self._index is None:
             return
         
         try:
-            import faiss
-            
             # 保存 FAISS 索引
             faiss_file = self._get_faiss_index_file(store_name)
-            faiss.write_index(self._index, str(faiss_file))
-            
-            # 保存文档和元数据
-            store_file = self._get_store_file(store_name)
-            data = {
-                "documents": self._documents,
-                "metadatas": self._metadatas
-            }
-            with open(store_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
+            faiss.write_index(self._cpu_index(), str(faiss_file))
+
+            # 保存文档和元数据：优先列式 parquet（SoA 布局，免去整库
+            # JSON 序列化），pyarrow 不可用时退回 JSON
+            if pq is not None:
+                new_table = pa.table({
+                    "document": pa.array(self._documents, type=pa.string()),
+                    "metadata": pa.array(
+                        [_dumps(m).decode('utf-8') for m in self._metadatas],
+                        type=pa.string()
+                    ),
+                })
+                if self._doc_table is not None:
+                    new_table = pa.concat_tables([self._doc_table, new_table])
+                pq.write_table(new_table, str(self._get_parquet_file(store_name)))
+            else:
+                self._materialize()
+                store_file = self._get_store_file(store_name)
+                store_file.write_bytes(_dumps({
+                    "documents": self._documents,
+                    "metadatas": self._metadatas
+                }))
+
+            # 日志内容已并入整块文件
+            log_file = self._get_log_file(store_name)
+            if log_file.exists():
+                log_file.unlink()
+
             print(f"索引已保存: {faiss_file}")
-        except ImportError:
-            print("FAISS 未安装，无法保存索引")
         except Exception as e:
             print(f"保存索引失败: {str(e)}")
     
@@ -185,30 +533,153 @@ class VectorStore:
         """
         if self._index is None:
             self._load_index()
-        
+
         if self._index is None or self._index.ntotal == 0:
             print("索引为空或未初始化")
             return []
-        
-        # 生成查询向量
-        query_embedding = self.embedding_model.embed(query)
+
+        # 生成查询向量（重复出现的热门查询直接走 LRU 缓存）
+        query_embedding = self._embed_query(query)
         if not query_embedding:
             print("生成查询向量失败")
             return []
-        
-        query_array = np.array([query_embedding]).astype('float32')
-        faiss.normalize_L2(query_array)
-        
+
+        return self.search_by_vector(query_embedding, k=k)
+
+    def _embed_query(self, query: str) -> List[float]:
+        """带 LRU 缓存的查询嵌入；失败结果不缓存"""
+        cached = self._query_vec_cache.get(query)
+        if cached is not None:
+            self._query_vec_cache.move_to_end(query)
+            return cached
+        vec = self.embedding_model.embed(query)
+        if vec:
+            self._query_vec_cache[query] = vec
+            if len(self._query_vec_cache) > self._QUERY_CACHE_SIZE:
+                self._query_vec_cache.popitem(last=False)
+        return vec
+
+    def search_by_vector(
+        self,
+        query_embedding: List[float],
+        k: int = 5
+    ) -> List[Tuple[str, float, dict]]:
+        """用预计算的查询向量搜索相似文档
+
+        调用方已经拿到嵌入时走这里，跳过重复的嵌入请求
+
+        Args:
+            query_embedding: 查询向量
+            k: 返回结果数量
+
+        Returns:
+            [(文档内容, 相似度分数, 元数据), ...]
+        """
+        if self._index is None:
+            self._load_index()
+
+        if self._index is None or self._index.ntotal == 0:
+            print("索引为空或未初始化")
+            return []
+
+        # 每线程复用同一块 (1, d) 缓冲，单查询路径零分配
+        dimension = len(query_embedding)
+        query_array = getattr(self._local, "query_buf", None)
+        if query_array is None or query_array.shape[1] != dimension:
+            query_array = np.empty((1, dimension), dtype=np.float32)
+            self._local.query_buf = query_array
+        query_array[0] = query_embedding
+        _normalize_rows(query_array)
+
+        # k 很小时 FAISS 相对 numpy 的优势在 top-k 选择器，而小 k 用
+        # 一次 GEMM（BLAS 多线程）+ argpartition 更快；仅精确 Flat
+        # 索引能零拷贝拿到内部矩阵，近似索引仍走图/倒排检索
+        if k <= self._SMALL_K:
+            matrix = self._flat_matrix()
+            if matrix is not None:
+                scores_vec = matrix @ query_array[0]
+                if k >= scores_vec.shape[0]:
+                    top = np.argsort(-scores_vec)
+                elif k == 1:
+                    top = np.array([int(np.argmax(scores_vec))])
+                else:
+                    top = np.argpartition(-scores_vec, k)[:k]
+                    top = top[np.argsort(-scores_vec[top])]
+                return self._collect_results(scores_vec[top], top)
+
         # 搜索
         scores, indices = self._index.search(query_array, k)
-        
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx >= 0 and idx < len(self._documents):
-                metadata = self._metadatas[idx] if idx < len(self._metadatas) else {}
-                results.append((self._documents[idx], float(score), metadata))
-        
-        return results
+
+        return self._collect_results(scores[0], indices[0])
+
+    def _flat_matrix(self) -> Optional[np.ndarray]:
+        """精确 Flat 索引内部向量矩阵的 (N, d) 零拷贝视图"""
+        # index_factory("Flat") 返回的是 IndexFlat（IndexFlatIP 只在
+        # read_index 反序列化时出现），按基类 + 度量类型判断
+        if not (isinstance(self._index, faiss.IndexFlat)
+                and self._index.metric_type == faiss.METRIC_INNER_PRODUCT):
+            return None
+        total = self._index.ntotal
+        if total == 0:
+            return None
+        return faiss.rev_swig_ptr(
+            self._index.get_xb(), total * self._index.d
+        ).reshape(total, self._index.d)
+
+    def _collect_results(self, scores, indices) -> List[Tuple[str, float, dict]]:
+        """把一行 FAISS 检索结果映射回 (文档, 分数, 元数据)
+
+        有效位掩码一次算完，.tolist() 批量转 Python 标量，
+        免去逐结果的 float() 调用和边界判断（FAISS 不会返回越界 ID，
+        只有结果不足 k 时补的 -1 需要滤掉）
+        """
+        indices = np.asarray(indices)
+        valid = indices >= 0
+        hit_ids = indices[valid].tolist()
+        hit_scores = np.asarray(scores)[valid].tolist()
+        return [
+            (self._document_at(idx), score, self._metadata_at(idx))
+            for idx, score in zip(hit_ids, hit_scores)
+        ]
+
+    def search_batch(
+        self,
+        queries: List[str],
+        k: int = 5
+    ) -> List[List[Tuple[str, float, dict]]]:
+        """批量搜索多个查询，返回与 queries 对齐的结果列表
+
+        所有查询一次批量嵌入、一次 FAISS 调用：FAISS 沿查询批次轴
+        多线程并行，整库矩阵每次扫描的访存开销摊到全部查询上，
+        比逐条 nq=1 搜索快得多
+
+        Args:
+            queries: 查询文本列表
+            k: 每个查询返回的结果数量
+
+        Returns:
+            [[(文档内容, 相似度分数, 元数据), ...], ...]
+        """
+        if self._index is None:
+            self._load_index()
+
+        if self._index is None or self._index.ntotal == 0:
+            print("索引为空或未初始化")
+            return [[] for _ in queries]
+
+        embeddings = self.embedding_model.embed_batch(queries)
+        if len(embeddings) != len(queries):
+            print("生成查询向量失败")
+            return [[] for _ in queries]
+
+        query_array = np.asarray(embeddings, dtype=np.float32)
+        _normalize_rows(query_array)
+
+        scores, indices = self._index.search(query_array, k)
+        return [
+            self._collect_results(score_row, index_row)
+            for score_row, index_row in zip(scores, indices)
+        ]
     
     def delete(self, ids: List[int] = None, store_name: str = "default"):
         """删除索引中的文档"""
@@ -234,19 +705,19 @@ class VectorStore:
         
         if self._index is None:
             return False
-        
+
+        # 整体改写文档集，先把 parquet 表并回内存列表
+        self._materialize()
+
         # 找出要删除的文档索引
         ids_to_delete = []
         new_documents = []
         new_metadatas = []
-        id_mapping = {}  # 旧ID -> 新ID
         
         for i, meta in enumerate(self._metadatas):
             if meta.get("source") == source:
                 ids_to_delete.append(i)
             else:
-                new_id = len(new_documents)
-                id_mapping[i] = new_id
                 new_documents.append(self._documents[i])
                 new_metadatas.append(meta)
         
@@ -258,13 +729,13 @@ class VectorStore:
         
         # 重建索引
         try:
-            import faiss
-            
             # 获取向量维度
             dimension = self._index.d
             
-            # 创建新索引
-            new_index = faiss.IndexIDMap(faiss.IndexFlatIP(dimension))
+            # 创建新索引（按剩余规模选精确或 HNSW）
+            new_index = self._maybe_to_gpu(
+                self._make_index(dimension, total_hint=len(new_documents))
+            )
             
             # 重新添加文档（使用新的连续ID）
             if new_documents:
@@ -280,12 +751,14 @@ class VectorStore:
                             embeddings.append(emb)
                 
                 if embeddings:
-                    embeddings_array = np.array(embeddings).astype('float32')
-                    faiss.normalize_L2(embeddings_array)
-                    
-                    # 添加到新索引
-                    new_ids = np.array(list(id_mapping.values()))
-                    new_index.add_with_ids(embeddings_array, new_ids)
+                    embeddings_array = np.asarray(embeddings, dtype=np.float32)
+                    _normalize_rows(embeddings_array)
+
+                    if not new_index.is_trained:
+                        new_index.train(embeddings_array)
+
+                    # 添加到新索引（隐式顺序 ID 与新行号对应）
+                    new_index.add(embeddings_array)
                 else:
                     print("警告: 无法生成嵌入，索引将不包含向量")
             
@@ -293,6 +766,7 @@ class VectorStore:
             self._index = new_index
             self._documents = new_documents
             self._metadatas = new_metadatas
+            self._mmap = False
             
             # 保存索引
             self.save_index(store_name)
@@ -311,12 +785,17 @@ class VectorStore:
         self._index = None
         self._documents = []
         self._metadatas = []
-        
+        self._doc_table = None
+        self._meta_cache.clear()
+        self._mmap = False
+
         # 删除文件
         faiss_file = self._get_faiss_index_file(store_name)
         store_file = self._get_store_file(store_name)
-        
-        for f in [faiss_file, store_file]:
+        parquet_file = self._get_parquet_file(store_name)
+        log_file = self._get_log_file(store_name)
+
+        for f in [faiss_file, store_file, parquet_file, log_file]:
             if f.exists():
                 f.unlink()
         
@@ -328,12 +807,91 @@ class VectorStore:
             self._load_index()
         
         return {
-            "document_count": len(self._documents),
+            "document_count": self._doc_total(),
             "index_size": self._index.ntotal if self._index else 0,
             "store_name": store_name
         }
 
 
+# chunk_text 的预编译正则（模块级只编译一次）
+_RE_NEWLINES = re.compile(r'\n+')
+_RE_SENTENCE = re.compile(r'(?<=[。！？!?])\s*')
+
+# 超过该长度的文本走 numpy 向量化分块（逐句 Python 循环太慢）
+_LARGE_TEXT_THRESHOLD = 100_000
+
+
+def _chunk_spans(boundaries: np.ndarray, total: int,
+                 chunk_size: int, overlap: int):
+    """给定句界偏移数组，贪心算出每块的起止偏移
+
+    纯数值循环，装了 numba 时编译成机器码执行（见下方 njit 包装）
+    """
+    # 初始容量按理想步长估算；句界落在 overlap 范围内时步长可能
+    # 退化到 1，块数会超出估算，写满时倍增扩容
+    cap = total // max(chunk_size - overlap, 1) + 2
+    starts = np.empty(cap, dtype=np.int64)
+    ends = np.empty(cap, dtype=np.int64)
+    count = 0
+    start = 0
+    while start < total:
+        target = start + chunk_size
+        pos = np.searchsorted(boundaries, target, side='right') - 1
+        if pos >= 0 and boundaries[pos] > start:
+            end = boundaries[pos]
+        else:
+            # 目标范围内没有句界，硬切
+            end = target if target < total else total
+        if count == cap:
+            cap *= 2
+            grown = np.empty(cap, dtype=np.int64)
+            grown[:count] = starts
+            starts = grown
+            grown = np.empty(cap, dtype=np.int64)
+            grown[:count] = ends
+            ends = grown
+        starts[count] = start
+        ends[count] = end
+        count += 1
+        if end >= total:
+            break
+        nxt = end - overlap
+        start = nxt if nxt > start else start + 1
+    return starts[:count], ends[:count]
+
+
+# 装了 numba 时把边界循环 JIT 成机器码（首次调用编译后缓存）
+try:
+    from numba import njit
+    _chunk_spans = njit(cache=True)(_chunk_spans)
+except ImportError:
+    pass
+
+
+def _chunk_text_large(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """大文本快速分块
+
+    句界偏移用 finditer 一次扫出放进 int64 数组，块边界由
+    _chunk_spans 的数值循环求出（可被 numba JIT），Python 层
+    只剩每块一次的切片，不再逐句循环。
+    """
+    total = len(text)
+    boundaries = np.fromiter(
+        (match.end() for match in _RE_SENTENCE.finditer(text)),
+        dtype=np.int64
+    )
+    if boundaries.size == 0 or boundaries[-1] != total:
+        boundaries = np.append(boundaries, total)
+
+    starts, ends = _chunk_spans(boundaries, total, chunk_size, overlap)
+    chunks = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
 def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
     """将文本分割成块
     
@@ -348,19 +906,38 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]
     if not text:
         return []
     
-    # 按句子分割
-    import re
-    
     # 清理多余空白
-    text = re.sub(r'\n+', '\n', text)
-    text = text.strip()
-    
-    # 按段落和句子分割
+    text = _RE_NEWLINES.sub('\n', text).strip()
+
+    # 大文档交给向量化分块，绕开逐段/逐句的解释器循环
+    if len(text) >= _LARGE_TEXT_THRESHOLD:
+        return _chunk_text_large(text, chunk_size, overlap)
+
+    # 按段落和句子分割。当前块用列表 + 累计长度维护：
+    # 字符串 += 每次都整块重新分配，大文档下是 O(N²)
     paragraphs = text.split('\n')
     
     chunks = []
-    current_chunk = ""
-    
+    current_parts: List[str] = []
+    current_len = 0
+
+    def _flush():
+        nonlocal current_parts, current_len
+        if current_parts:
+            chunks.append('\n'.join(current_parts))
+            current_parts = []
+            current_len = 0
+
+    def _append(piece: str):
+        nonlocal current_len
+        if current_len + len(piece) < chunk_size:
+            current_parts.append(piece)
+            current_len += len(piece) + 1
+        else:
+            _flush()
+            current_parts.append(piece)
+            current_len = len(piece) + 1
+
     for para in paragraphs:
         para = para.strip()
         if not para:
@@ -368,36 +945,21 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]
         
         # 如果段落本身很大，按句子分割
         if len(para) > chunk_size:
-            sentences = re.split(r'(?<=[。！？!?])\s*', para)
-            for sentence in sentences:
+            for sentence in _RE_SENTENCE.split(para):
                 sentence = sentence.strip()
-                if not sentence:
-                    continue
-                
-                if len(current_chunk) + len(sentence) < chunk_size:
-                    current_chunk += sentence + "\n"
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = sentence + "\n"
+                if sentence:
+                    _append(sentence)
         else:
-            if len(current_chunk) + len(para) < chunk_size:
-                current_chunk += para + "\n"
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = para + "\n"
-    
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+            _append(para)
+
+    _flush()
     
     # 如果没有分句成功，使用简单的滑动窗口
     if len(chunks) == 0 and len(text) > chunk_size:
-        chars = list(text)
-        for i in range(0, len(chars), chunk_size - overlap):
-            chunk = ''.join(chars[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk.strip())
+        for i in range(0, len(text), chunk_size - overlap):
+            chunk = text[i:i + chunk_size].strip()
+            if chunk:
+                chunks.append(chunk)
     
     return chunks
 